@@ -13,16 +13,26 @@
 '''
 
 import sys
-from my_utils import fRead
-from my_utils.nodeCourse import NodeCourse
+from my_utils.scnCache import load_scenario
+from my_utils.scnSlice import load_slice, slice_option
+from my_utils.profiler import g_profiler
+from my_utils.scnMerge import merge_scenario, parent_course
+from my_utils.bulkWriter import BulkWriter, format_movements_lines, output_filename
 
 
 if len(sys.argv) < 3:
-    print ("\nUsage:\n python3 addScenarios.py <childScenario> [-p <parentScenario>] [-r] [xoff=...] [yoff=...] [zoff=...]\n")
+    print ("\nUsage:\n python3 addScenarios.py <childScenario> [<childScenario> ...] [-p <parentScenario>] [-n <node,...>] [-r] [--nodes <list>] [--t0 T] [--t1 T] [--profile] [--cprofile out.prof] [--no-cache] [-z] [xoff=...] [yoff=...] [zoff=...]\n")
     print ("  <childScenario>\tThe base scenario to be modified.")
     print ("  -p <parentScenario>\tParent mobility scenario whose first node the child scenario will follow.")
+    print ("  -n <node,...>\t\tParent nodes followed by the child scenarios, the k-th child follows the k-th node (cyclically).")
     print ('''  -r\t\t\tCoordinates in child scenario are considered relative to parent coordinates.
-            \t\t (By default initial position of child scenario is maintained in the joint scenario)\n''')
+            \t\t (By default initial position of child scenario is maintained in the joint scenario)''')
+    print ("  --nodes <list>\t\tMerge only these child nodes, e.g. 0-200,305.")
+    print ("  --t0 T, --t1 T\t\tMerge only the time window [T0, T1] (courses are trimmed with interpolated waypoints).")
+    print ("  --profile\t\tPrint the time of each stage and the work counters at exit.")
+    print ("  --cprofile out.prof\tSave cProfile statistics of the run to out.prof.")
+    print ("  --no-cache\t\tAlways parse the .movements files instead of using their binary cache.")
+    print ("  -z\t\t\tWrite the joint scenario gzip-compressed (<childScenario>_mx.movements.gz).\n")
     print (" Some transforms can be pre-applied to child scenario or even without being added to a parent scenario:")
     print ("  xoff\t\t\tCustom X offset to be added to child scenario.")
     print ("  yoff\t\t\tCustom Y offset to be added to child scenario.")
@@ -35,30 +45,58 @@ if len(sys.argv) < 3:
 op = None   # Used to track -p option when iterating through arguments
 rel = False # Relative coordinates
 parentScn = None
+parentNodes = [0]
+childNodes = None # Child nodes to merge, all by default
+t0 = None # Time window of the joint scenario
+t1 = None
+selection = None # --nodes, --t0 and --t1 values (arguments of load_slice)
+useCache = True
+compress = False
+writeBatch = 1024 # Number of nodes formatted at once when writing the joint scenario
 xOff = 0
 yOff = 0
 zOff = 0
 zMin = None
 zMax = None
-scn3D = False
 scaling = False
 # Processing of arguments and options
-childScn = sys.argv[1]
+childScns = [sys.argv[1]]
 for arg in sys.argv[2:]:
     if arg.startswith('-'):
         arg = arg.lstrip('-')
-        if op == 'p':
-            print("scenario name expected after '-p' option")
+        if op is not None:
+            print("value expected after '-{}' option".format(op))
             op = None
-        elif arg == 'p':
+        elif arg in ('p', 'n', 'nodes', 't0', 't1', 'cprofile'):
             op = arg
         elif arg == 'r':
             rel = True
+        elif arg == 'profile':
+            g_profiler.enable()
+        elif arg == 'no-cache':
+            useCache = False
+        elif arg == 'z':
+            compress = True
         else:
             print("unknown option '-{}' ignored".format(arg))
     elif op == 'p':
         parentScn = arg
         op = None
+    elif op == 'cprofile':
+        g_profiler.enable(cprofileFile=arg, summary=False)
+        op = None
+    elif op in ('nodes', 't0', 't1'):
+        try:
+            selection = slice_option('--' + op, arg, selection)
+        except ValueError as e:
+            sys.exit(str(e) + '\n')
+        op = None
+    elif op == 'n':
+        try:
+            parentNodes = [int(node) for node in arg.split(',')]
+        except ValueError as e:
+            print (e, "...ignored")
+        op = None
     else:
         argpair = arg.split('=')
         if len(argpair) == 2 and argpair[0] in ["xoff", "yoff", "zoff", "zmin", "zmax"]:
@@ -75,13 +113,19 @@ for arg in sys.argv[2:]:
                     zMax = float(argpair[1])
             except ValueError as e:
                 print (e, "...ignored")
+        elif len(argpair) == 1:
+            childScns.append(arg)
         else:
             print("unknown argument '{}' ignored".format(argpair[0]))
 if zMin is not None or zMax is not None:
     scaling = True
+if selection is not None:
+    childNodes, t0, t1 = selection['nodes'], selection['t0'], selection['t1']
 # Validation of options
 if op == 'p':
     print ("warning: '-p' option was specified but no parent scenario name was given")
+if op == 'n':
+    print ("warning: '-n' option was specified but no parent nodes were given")
 if rel == True:
     if parentScn is None:
         print ("warning: '-r' option was specified but parent scenario was not given")
@@ -92,97 +136,83 @@ if zOff!=0 and scaling:
 
 # Read information from scenario files
 # A joint scenario is considered 3D when the child scenario is 3D or the parent scenario is 3D or an zOffset is given
-childtimes, childlocations = fRead.read_bmScenario(childScn + ".movements")
-mx_offset = [xOff, yOff, zOff]
-if mx_offset[2] != 0:
-    scn3D = True
+# The parent scenario is read once and every child scenario is merged with its parent node by the array engine:
+# child scenario k follows parent node parentNodes[k % len(parentNodes)]
 if parentScn is not None:
-    parenttimes, parentlocations = fRead.read_bmScenario(parentScn + ".movements")
-    if not rel:
-        mx_offset[0] -= parentlocations[0][0][0]
-        mx_offset[1] -= parentlocations[0][0][1]
-        if len(parentlocations[0][0]) == 3:
-            mx_offset[2] -= parentlocations[0][0][2]
-            scn3D = True
-    # Only the first node in the parent scenario (if it contains more than 1 node) is considered
-    parent = NodeCourse (parenttimes[0], parentlocations[0])
+    if t0 is None and t1 is None:
+        parentscenario = load_scenario(parentScn + ".movements", useCache=useCache)
+    else:
+        parentscenario = load_slice(parentScn + ".movements", t0=t0, t1=t1, useCache=useCache)
+    invalidNodes = [n for n in parentNodes if not 0 <= n < parentscenario.node_count]
+    if invalidNodes:
+        sys.exit("parent nodes {} not found, {} has {} nodes\n".format(",".join(map(str, invalidNodes)), parentScn + ".movements", parentscenario.node_count))
 else:
-    parent = NodeCourse ([0], [[0, 0]])
-if len(childlocations[0][0]) == 3:
-    scn3D = True
+    parentscenario = None
+    parentNodes = [0]
+parents = [parent_course(parentscenario, n) for n in parentNodes]
 
-# If scaling is to be performed, we need to first find the Z-Min and Z-Max values in child scenario:
-if scaling:
-    if len (childlocations[0][0]) < 3:
-        print("child scenario is 2-dimensional, Z-scaling is not applicable")
-        scaling = False
+for k, childScn in enumerate(childScns):
+    # With --nodes, --t0 or --t1 only the selected child nodes are read, trimmed to the time window
+    if childNodes is None and t0 is None and t1 is None:
+        childscenario = load_scenario(childScn + ".movements", useCache=useCache)
     else:
-        child_zMin = None
-        child_zMax = None
-        for node in childlocations:
-            for location in node:
-                if child_zMin is None:
-                    child_zMin = location[2]
-                    child_zMax = child_zMin
-                else:
-                    if location[2] < child_zMin:
-                        child_zMin = location[2]
-                    if location[2] > child_zMax:
-                        child_zMax = location[2]
-        if child_zMin == child_zMax:
-            print("child scenario contained in plane Z=" + str(child_zMin) + ", Z-scaling is not applicable")
-            scaling = False
+        childscenario = load_slice(childScn + ".movements", nodes=childNodes, t0=t0, t1=t1, useCache=useCache)
+    parentNode = parentNodes[k % len(parentNodes)]
+    parent = parents[k % len(parentNodes)]
+    if len(childScns) > 1:
+        print("{}:".format(childScn) + ("" if parentscenario is None else " following parent node {}".format(parentNode)))
+    scn3D = False
+    mx_offset = [xOff, yOff, zOff]
+    if mx_offset[2] != 0:
+        scn3D = True
+    if parentscenario is not None:
+        parentlocations = parentscenario.get_node(parentNode)[1]
+        if not rel:
+            mx_offset[0] -= parentlocations[0][0]
+            mx_offset[1] -= parentlocations[0][1]
+            if len(parentlocations[0]) == 3:
+                mx_offset[2] -= parentlocations[0][2]
+                scn3D = True
+    if childscenario.dims == 3:
+        scn3D = True
+
+    # If scaling is to be performed, we need to first find the Z-Min and Z-Max values in child scenario:
+    zScaling = None
+    if scaling:
+        if childscenario.dims < 3:
+            print("child scenario is 2-dimensional, Z-scaling is not applicable")
         else:
-            # we calculate the scaling values s_a and s_b in: z2 = s_a*z1 + s_b
-            if zMax is None:
-                zMax = child_zMax
-            if zMin is None:
-                zMin = child_zMin
-            s_a = (zMax - zMin)/(child_zMax-child_zMin)
-            s_b = zMin - s_a * child_zMin
-            print("child scenario's Z-Min was:",child_zMin)
-            print("child scenario's Z-Max was:",child_zMax)
-            # we make sure that if Z-Offset exist, it is overridden
-            if len(mx_offset) == 3:
+            # taken from the statistics index of the scenario (stored in its binary cache)
+            child_zMin, child_zMax = childscenario.get_stats().get_range(2)
+            if child_zMin == child_zMax:
+                print("child scenario contained in plane Z=" + str(child_zMin) + ", Z-scaling is not applicable")
+            else:
+                # we calculate the scaling values s_a and s_b in: z2 = s_a*z1 + s_b
+                scnZMax = child_zMax if zMax is None else zMax
+                scnZMin = child_zMin if zMin is None else zMin
+                s_a = (scnZMax - scnZMin)/(child_zMax-child_zMin)
+                s_b = scnZMin - s_a * child_zMin
+                zScaling = (s_a, s_b)
+                print("child scenario's Z-Min was:",child_zMin)
+                print("child scenario's Z-Max was:",child_zMax)
+                # we make sure that if Z-Offset exist, it is overridden
                 mx_offset[2] = 0
 
-# For each node in the child scenario the positions at each new waypoint are calculated
-newchildtimes = []
-newchildlocations =[]
-for n in range(len(childtimes)):
-    child = NodeCourse (childtimes[n], childlocations[n])
-    mx_times = sorted (set (child.get_wptimes() + parent.get_wptimes()))
-    mx_locations = []
-    for t in mx_times:
-        childlocation = child.get_location(t)
-        parentlocation = parent.get_location(t)
-        # This is a compensation when 2D and 3D scenarios are added
-        if (len(childlocation) == 2) and scn3D:
-            childlocation.append(0)
-        if (len(parentlocation) == 2) and scn3D:
-            parentlocation.append(0)
-        newlocation = []
-        for d in range (len(childlocation)): # For each dimension X, Y and (if applicable) Z
-            if scaling and d == 2:
-                newlocation.append(childlocation[d]*s_a + parentlocation[d] + s_b + mx_offset[d])
-            else:
-                newlocation.append(childlocation[d] + parentlocation[d] + mx_offset[d])
-        mx_locations.append(newlocation)
-    newchildtimes.append(mx_times)
-    newchildlocations.append(mx_locations)
-print ("child scenario update completed")
-try:
-    with open(childScn + "_mx.movements", 'w') as newScenarioFile:
-        if scn3D:
-            newScenarioFile.write("#3D\n")
-        for nodetimes, nodelocations in zip (newchildtimes, newchildlocations):
-            line = ""
-            for time, location in zip (nodetimes, nodelocations):
-                line += f"{time} {location[0]} {location[1]} "
-                if scn3D:
-                    line += f"{location[2]} "
-            line = line.strip()+'\n'
-            newScenarioFile.write(line)
-    print ("successfully created {}\n".format(childScn + "_mx.movements"))
-except:
-    print("error while writing to file {}: {}, {}".format(childScn + "_mx.movements", sys.exc_info()[0], sys.exc_info()[1]))
+    # The positions of every child node at each joint waypoint time are calculated as arrays
+    with g_profiler.stage("merge"):
+        mxTimes, mxCoords, mxOffsets = merge_scenario(childscenario, parent, mx_offset, scn3D, zScaling)
+    g_profiler.count("waypoints merged", len(mxTimes))
+    mxCoords = mxCoords[:, :3 if scn3D else 2]
+    print ("child scenario update completed")
+    # Nodes are formatted in batches and written through a buffered (optionally gzip-compressed) writer
+    mxFilename = output_filename(childScn + "_mx.movements", compress)
+    try:
+        with BulkWriter(mxFilename, compress) as newScenarioFile:
+            if scn3D:
+                newScenarioFile.write("#3D\n")
+            for b in range(0, childscenario.node_count, writeBatch):
+                offsets = mxOffsets[b:b+writeBatch+1]
+                newScenarioFile.write(format_movements_lines(mxTimes[offsets[0]:offsets[-1]], mxCoords[offsets[0]:offsets[-1]], offsets - offsets[0]))
+        print ("successfully created {}\n".format(mxFilename))
+    except:
+        print("error while writing to file {}: {}, {}".format(mxFilename, sys.exc_info()[0], sys.exc_info()[1]))
@@ -0,0 +1,115 @@
+'''
+* Copyright (c) 2019 - 2020 Oscar Bautista
+*
+* This program is free software; you can redistribute it and/or modify it
+* under the terms of the GNU General Public License version 2 as published
+* by the Free Software Foundation.
+*
+* DESCRIPTION:
+* Extracts the exact contacts (link up and down times) between the nodes of a BonnMotion 2D or 3D scenario
+* for a given radio range. Contacts are written as CSV (node1,node2,start,end,duration) or as a ONE
+* simulator contact trace ("time CONN node1 node2 up|down").
+*
+* AUTHOR: Oscar Bautista <obaut004@fiu.edu>
+'''
+
+import sys
+from multiprocessing import Pool
+from my_utils.bulkWriter import BulkWriter, output_filename
+from my_utils.scnCache import load_scenario
+from my_utils.contactTrace import init_worker, trace_window, scenario_breakpoints, time_windows, stitch_windows, format_contacts
+
+def usage():
+    print ("\nUsage:\n python3 bmContacts.py <scenario> -r <range> [--format csv|one] [-o <outFile>] [-j N] [--no-cache] [-z]\n")
+    print ("  -r <range>\t\tRadio range, nodes closer than this distance are in contact.")
+    print ("  --format csv|one\tCSV lines node1,node2,start,end,duration (default) or ONE contact trace events.")
+    print ("  -o <outFile>\t\tOutput file (default <scenario>_contacts.csv or <scenario>_contacts.txt).")
+    print ("  -j N\t\t\tNumber of processes, the scenario time is split in windows traced in parallel.")
+    print ("  --no-cache\t\tAlways parse the .movements file instead of using its binary cache.")
+    print ("  -z\t\t\tWrite the output gzip-compressed.\n")
+
+def main():
+    # Options
+    radius = None
+    traceFormat = 'csv'
+    outFile = None
+    useCache = True
+    compress = False
+    jobs = 1
+    args = []
+    argIter = iter(sys.argv[1:])
+    for arg in argIter:
+        if arg == '-r':
+            try:
+                radius = float(next(argIter, ''))
+            except ValueError:
+                sys.exit("a range is expected after '-r' option\n")
+        elif arg == '--format':
+            traceFormat = next(argIter, None)
+            if traceFormat not in ('csv', 'one'):
+                sys.exit("'csv' or 'one' expected after '--format' option\n")
+        elif arg == '-o':
+            outFile = next(argIter, None)
+        elif arg == '--no-cache':
+            useCache = False
+        elif arg == '-z':
+            compress = True
+        elif arg == '-j':
+            try:
+                jobs = max(1, int(next(argIter, '')))
+            except ValueError:
+                print("number of jobs expected after '-j' option, running serially")
+        else:
+            args.append(arg)
+    if len(args) < 1 or radius is None or radius <= 0:
+        usage()
+        sys.exit(1)
+
+    bmScenario = args[0]
+    if "." in bmScenario:
+        bmFilename = bmScenario
+    else:
+        bmFilename = bmScenario + ".movements"
+    if outFile is None:
+        outFile = bmScenario.split(".")[0] + ("_contacts.csv" if traceFormat == 'csv' else "_contacts.txt")
+    outFile = output_filename(outFile, compress)
+
+    # The scenario time is split at the waypoint times, where node motions change, into windows that are
+    # traced independently (in a process pool with more than one job). Contacts spanning several windows are
+    # joined in window order and written as soon as they are over, so they are never all held in memory
+    try:
+        bmScn = load_scenario(bmFilename, useCache=useCache)
+        scn3D = bmScn.is3D
+        dims = 3 if scn3D else 2
+        breakpoints = scenario_breakpoints(bmScn)
+        windows = time_windows(breakpoints, jobs * 8) if len(breakpoints) > 1 else []
+        contactCount = 0
+        with BulkWriter(outFile, compress) as contactsFile:
+            if traceFormat == 'csv':
+                contactsFile.write("node1,node2,start,end,duration\n")
+            if jobs > 1 and len(windows) > 1:
+                pool = Pool(jobs, initializer=init_worker, initargs=(bmFilename, radius, dims, useCache))
+                windowResults = pool.imap(trace_window, windows)
+            else:
+                pool = None
+                init_worker(bmFilename, radius, dims, useCache)
+                windowResults = map(trace_window, windows)
+            try:
+                for ups, closed in stitch_windows(windowResults):
+                    contactsFile.write(format_contacts(traceFormat, ups, closed, bmScn.node_count, bmScn.node_ids))
+                    contactCount += len(closed[0])
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+        print("\nBonnMotion contact extraction completed:")
+        print("\t{} scenario, {} nodes, range {:g}".format("3D" if scn3D else "2D", bmScn.node_count, radius))
+        print("\t{} contacts over {} motion intervals".format(contactCount, max(0, len(breakpoints) - 1)))
+        print("\n{} created successfully\n".format(outFile))
+    except FileNotFoundError:
+        sys.exit(str(sys.exc_info()[1])+'\n')
+    except:
+        print ("error while processing {}: {}, {}".format(bmFilename, sys.exc_info()[0], sys.exc_info()[1]), '\n')
+
+if __name__ == '__main__':
+    main()
@@ -12,106 +12,96 @@
 * AUTHOR: Oscar Bautista <obaut004@fiu.edu>
 '''
 
-import sys, math
+import sys
+from multiprocessing import Pool
+from my_utils.bulkWriter import BulkWriter, output_filename
+from my_utils.scnCache import load_scenario
+from my_utils.scnSlice import load_slice, slice_option
+from my_utils.profiler import g_profiler, profile_option
+from my_utils.ns2Mobility import convert_node, convert_chunk, scenario_chunks
 
-# Function to calculate distance between two coordinates
-def calculate_distance (origin, destination):
-    sum = 0
-    for i in range(len (origin)):
-        sum += (destination[i] - origin[i])**2
-    return math.sqrt(sum)
+def main():
+    # Options
+    useCache = True
+    compress = False
+    jobs = 1
+    selection = None # nodes and time window to convert (arguments of load_slice)
+    args = []
+    argIter = iter(sys.argv[1:])
+    for arg in argIter:
+        if arg == '--no-cache':
+            useCache = False
+        elif arg == '-z':
+            compress = True
+        elif arg in ('--profile', '--cprofile'):
+            try:
+                profile_option(arg, argIter)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg in ('--nodes', '--t0', '--t1'):
+            try:
+                selection = slice_option(arg, next(argIter, None), selection)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg == '-j':
+            try:
+                jobs = max(1, int(next(argIter, '')))
+            except ValueError:
+                print("number of jobs expected after '-j' option, running serially")
+        else:
+            args.append(arg)
 
-# Verify that the source filename is given, if not, then the BonnMotion scenario name is requested
-if len(sys.argv) >= 2:
-    bmScenario = sys.argv[1]
-else:
-    bmScenario = input ("BonnMotion Scenario: ")
+    # Verify that the source filename is given, if not, then the BonnMotion scenario name is requested
+    if len(args) >= 1:
+        bmScenario = args[0]
+    else:
+        bmScenario = input ("BonnMotion Scenario: ")
 
-if len(bmScenario) == 0:
-    sys.exit("no filename was given, exiting now...\n")
+    if len(bmScenario) == 0:
+        sys.exit("no filename was given, exiting now...\n")
 
-if "." in bmScenario:
-    bmFilename = bmScenario
-else:
-    bmFilename = bmScenario + ".movements"
-ns2Filename = bmScenario.split(".")[0] + ".ns_movements"
+    if "." in bmScenario:
+        bmFilename = bmScenario
+    else:
+        bmFilename = bmScenario + ".movements"
+    ns2Filename = output_filename(bmScenario.split(".")[0] + ".ns_movements", compress)
 
-# Open BonnMotion Scenario for conversion and creates output ns2 mobility file
-try:
-    with open (bmFilename, 'r') as bmFile, open (ns2Filename, 'w') as ns2file:
-        wpSize = 3
-        scn3D = False
-        bmLine = bmFile.readline()
-        if bmLine.strip() == "#3D":
-            scn3D = True
-            wpSize = 4
-            bmLine = bmFile.readline()
-        n = -1
-        n_ns2 = 0
-        while (bmLine):
-            if bmLine.strip().startswith('#'):
-                bmLine=bmFile.readline()
-                continue
-            n += 1
-            tokens = bmLine.split()
-            if (len(tokens) % (wpSize)) != 0:
-                print ("error at node {}: line does not contain correct number of values ({})...node skipped".format(n, len(tokens)) )
-                bmLine = bmFile.readline()
-                continue
-            # create times and locations vectors for the current node
-            times = []
-            locations = []
-            for i in range(0, len(tokens), wpSize):
-                try:
-                    times.append(float (tokens[i]) )
-                    location= []
-                    for d in range (1, wpSize):
-                        location.append(float (tokens[i+d]) )
-                    locations.append(location)
-                except ValueError:
-                    print ("error at node {}: invalid number:{}...waypoint skipped".format(n, str(sys.exc_info()[1]).split(':')[-1] ) )
-                    if len (times) > len (locations):
-                        times = times[:-1]
-                    bmLine = bmFile.readline()
-                    continue
-            # process and generate ns2 mobility for the current node
-            location = locations[0]
-            ns2file.write("$node_({}) set X_ {}\n".format(n_ns2, location[0]))
-            ns2file.write("$node_({}) set Y_ {}\n".format(n_ns2, location[1]))
-            if scn3D:
-                ns2file.write("$node_({}) set Z_ {}\n".format(n_ns2, location[2]))
-            for i in range (len (times) - 1):
-                time = times[i+1] - times[i]
-                origin = locations[i]
-                destination = locations[i+1]
-                if time == 0:
-                    print("warning at node {}: two waypoints with same time".format(n))
-                    if destination[0] != origin[0]:
-                        ns2file.write("$ns_ at {} \"$node_({}) set X_ {}\"\n".format(times[i], n_ns2, destination[0]))
-                    if destination[1] != origin[1]:
-                        ns2file.write("$ns_ at {} \"$node_({}) set Y_ {}\"\n".format(times[i], n_ns2, destination[1]))
-                    if scn3D and (destination[2] != origin[2]):
-                        ns2file.write("$ns_ at {} \"$node_({}) set Z_ {}\"\n".format(times[i], n_ns2, destination[2]))
-                    continue
-                elif time < 0:
-                    print("warning at node {}: trying to insert a waypoint with a past timestamp...".format(n))
-                    print("...the resulting ns2mobility could experience an unexpected pattern")
-                    continue
-                speed = calculate_distance(origin, destination)/time
-                if scn3D:
-                    outputLine = "$ns_ at {} \"$node_({}) setdest {} {} {} {}\"\n".format(times[i], n_ns2, destination[0], destination[1], destination[2], speed)
-                else:
-                    outputLine = "$ns_ at {} \"$node_({}) setdest {} {} {}\"\n".format(times[i], n_ns2, destination[0], destination[1], speed)
-                if origin == destination:
-                    outputLine = "# " + outputLine
-                ns2file.write (outputLine)
-            n_ns2 += 1
-            bmLine = bmFile.readline()
-    print("\nBonnMotion to Ns2mobility conversion completed:")
-    print("\t{} scenario".format("3D" if scn3D else "2D"))
-    print("\t{} out of {} nodes' mobility converted".format(n_ns2, n+1))
-    print("\n{} created successfully\n".format(ns2Filename))
-except FileNotFoundError:
-    sys.exit(str(sys.exc_info()[1])+'\n')
-except:
-    print ("error while processing {}: {}, {}".format(bmFilename, sys.exc_info()[0], sys.exc_info()[1]), '\n')
+    # Open BonnMotion Scenario for conversion and creates output ns2 mobility file
+    # The BonnMotion scenario is loaded through its binary cache (memory-mapped when up to date)
+    # With more than one job, chunks of nodes are converted in a process pool and written back in node order
+    # Output is buffered and written in large chunks, gzip-compressed with the '-z' option
+    # With --nodes, --t0 or --t1 only the selected nodes are read and their courses trimmed to the time window
+    try:
+        if selection is not None:
+            bmScn = load_slice(bmFilename, useCache=useCache, **selection)
+        else:
+            bmScn = load_scenario(bmFilename, useCache=useCache)
+        scn3D = bmScn.is3D
+        with BulkWriter(ns2Filename, compress) as ns2file, g_profiler.stage("convert"):
+            if jobs > 1 and bmScn.node_count > 1:
+                chunkSize = max(1, min(256, bmScn.node_count // (jobs * 8)))
+                with Pool(jobs) as pool:
+                    for ns2Text, messages in pool.imap(convert_chunk, scenario_chunks(bmScn, chunkSize)):
+                        for message in messages:
+                            print(message)
+                        ns2file.write(ns2Text)
+            else:
+                for n_ns2, (n, nodeTimes, nodeLocations) in enumerate(bmScn.iter_nodes()):
+                    ns2Text, messages = convert_node(n, n_ns2, nodeTimes, nodeLocations, scn3D)
+                    for message in messages:
+                        print(message)
+                    ns2file.write(ns2Text)
+            n_ns2 = bmScn.node_count
+            n = bmScn.file_node_count - 1
+            g_profiler.count("nodes converted", n_ns2)
+        print("\nBonnMotion to Ns2mobility conversion completed:")
+        print("\t{} scenario".format("3D" if scn3D else "2D"))
+        print("\t{} out of {} nodes' mobility converted".format(n_ns2, n+1))
+        print("\n{} created successfully\n".format(ns2Filename))
+    except FileNotFoundError:
+        sys.exit(str(sys.exc_info()[1])+'\n')
+    except:
+        print ("error while processing {}: {}, {}".format(bmFilename, sys.exc_info()[0], sys.exc_info()[1]), '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+'''
+* Copyright (c) 2019 - 2020 Oscar Bautista
+*
+* This program is free software; you can redistribute it and/or modify it
+* under the terms of the GNU General Public License version 2 as published
+* by the Free Software Foundation.
+*
+* DESCRIPTION:
+* Converts mobility scenarios between BonnMotion (.movements), NS2 mobility (setdest), NS3 waypoint CSV
+* and a binary (.npz) format, in both directions. In batch mode all the scenarios of a directory are
+* converted in a single run by a pool of worker processes.
+*
+* AUTHOR: Oscar Bautista <obaut004@fiu.edu>
+'''
+
+import sys, os, time
+from multiprocessing import Pool
+from my_utils.scnFormats import FORMATS, get_format, detect_format, converted_filename, compressed_filename, convert_file
+from my_utils.scnSlice import slice_option
+from my_utils.profiler import profile_option
+
+def usage():
+    print ("\nUsage:\n python3 convertScenario.py <input> [<output>] [--from FORMAT] [--to FORMAT] [-z] [--no-cache]")
+    print (" python3 convertScenario.py --batch <inDir> <outDir> --to FORMAT [--from FORMAT] [-j N] [-z] [--no-cache]\n")
+    print ("  --from FORMAT\t\tFormat of the input files, detected from their extension by default.")
+    print ("  --to FORMAT\t\tFormat of the output files, detected from the output filename by default.")
+    print ("  \t\t\tFormats: " + ", ".join("{} ({})".format(name, " ".join(f.extensions)) for name, f in FORMATS.items()) + ".")
+    print ("  --batch\t\tConvert every scenario of <inDir> and write the results to <outDir>.")
+    print ("  -j N\t\t\tNumber of worker processes of the batch mode (all cores by default).")
+    print ("  -z\t\t\tWrite the output gzip-compressed (zip-compressed for the binary format).")
+    print ("  --no-cache\t\tAlways parse BonnMotion files instead of using their binary cache.")
+    print ("  --nodes 0-200,305 --t0 T0 --t1 T1\tConvert only some nodes and/or the time window [T0, T1].")
+    print ("  --profile, --cprofile out.prof\tPrint the time of each stage, or save cProfile statistics.\n")
+
+# Converts one file in a worker process, errors are returned so that one bad file does not stop the batch
+def convert_job(job):
+    inFile, outFile, inFormat, outFormat, compress, useCache, selection = job
+    start = time.perf_counter()
+    try:
+        scenario, messages = convert_file(inFile, outFile, FORMATS.get(inFormat), FORMATS[outFormat], compress, useCache, selection)
+    except Exception as e:
+        return inFile, outFile, None, [], "{}: {}".format(type(e).__name__, e), time.perf_counter() - start
+    return inFile, outFile, (scenario.node_count, len(scenario.times), scenario.is3D), messages, None, time.perf_counter() - start
+
+# Conversion jobs of the scenarios of 'inDir' (files with a known extension, or the extension of 'inFormat')
+def batch_jobs(inDir, outDir, inFormat, outFormat, compress, useCache, selection):
+    jobs = []
+    outFiles = set()
+    for name in sorted(os.listdir(inDir)):
+        inFile = os.path.join(inDir, name)
+        scnFormat = detect_format(name)
+        if not os.path.isfile(inFile) or scnFormat is None or (inFormat is not None and scnFormat.name != inFormat):
+            continue
+        outFile = converted_filename(inFile, get_format(outFormat), outDir, compress)
+        if os.path.abspath(outFile) == os.path.abspath(inFile):
+            print("{} skipped, it would be overwritten by its conversion".format(inFile))
+            continue
+        if outFile in outFiles:
+            print("{} skipped, another scenario of {} is converted to {}".format(inFile, inDir, outFile))
+            continue
+        outFiles.add(outFile)
+        jobs.append((inFile, outFile, scnFormat.name, outFormat, compress, useCache, selection))
+    return jobs
+
+def print_result(result):
+    inFile, outFile, summary, messages, error, seconds = result
+    for message in messages:
+        print("{}: {}".format(inFile, message))
+    if error is not None:
+        print("error while converting {}: {}".format(inFile, error))
+    else:
+        print("\t{} -> {}: {} nodes, {} waypoints, {} ({:.2f}s)".format(inFile, outFile, summary[0], summary[1], "3D" if summary[2] else "2D", seconds))
+
+def main():
+    # Options
+    inFormat = None
+    outFormat = None
+    batch = False
+    jobs = os.cpu_count() or 1
+    compress = False
+    useCache = True
+    selection = None # nodes and time window to convert (arguments of scnFormats.read_scenario)
+    args = []
+    argIter = iter(sys.argv[1:])
+    for arg in argIter:
+        if arg in ('--from', '--to'):
+            name = next(argIter, None)
+            if name not in FORMATS:
+                sys.exit("one of {} is expected after '{}' option\n".format(", ".join(FORMATS), arg))
+            if arg == '--from':
+                inFormat = name
+            else:
+                outFormat = name
+        elif arg == '--batch':
+            batch = True
+        elif arg == '-j':
+            try:
+                jobs = max(1, int(next(argIter, '')))
+            except ValueError:
+                sys.exit("number of jobs expected after '-j' option\n")
+        elif arg == '-z':
+            compress = True
+        elif arg == '--no-cache':
+            useCache = False
+        elif arg in ('--profile', '--cprofile'):
+            try:
+                profile_option(arg, argIter)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg in ('--nodes', '--t0', '--t1'):
+            try:
+                selection = slice_option(arg, next(argIter, None), selection)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg.startswith('-'):
+            usage()
+            sys.exit(1)
+        else:
+            args.append(arg)
+
+    if batch:
+        if len(args) != 2 or outFormat is None:
+            usage()
+            sys.exit(1)
+        inDir, outDir = args
+        if not os.path.isdir(inDir):
+            sys.exit("{} is not a directory\n".format(inDir))
+        os.makedirs(outDir, exist_ok=True)
+        jobList = batch_jobs(inDir, outDir, inFormat, outFormat, compress, useCache, selection)
+        print("\nConverting {} scenarios from {} to {} ({}) with {} processes:".format(len(jobList), inDir, outDir, outFormat, min(jobs, len(jobList))))
+        start = time.perf_counter()
+        # each worker converts whole files, results are printed as the files are completed
+        failed = 0
+        if jobs > 1 and len(jobList) > 1:
+            with Pool(min(jobs, len(jobList))) as pool:
+                results = pool.imap_unordered(convert_job, jobList)
+                for result in results:
+                    print_result(result)
+                    failed += result[4] is not None
+        else:
+            for job in jobList:
+                result = convert_job(job)
+                print_result(result)
+                failed += result[4] is not None
+        print("\n{} scenarios converted, {} failed ({:.2f}s)\n".format(len(jobList) - failed, failed, time.perf_counter() - start))
+        if failed:
+            sys.exit(1)
+        return
+
+    if len(args) == 0 or len(args) > 2 or (len(args) == 1 and outFormat is None):
+        usage()
+        sys.exit(1)
+    inFile = args[0]
+    if inFormat is None and detect_format(inFile) is None:
+        sys.exit("the format of {} is unknown, use the '--from' option\n".format(inFile))
+    outFile = args[1] if len(args) == 2 else converted_filename(inFile, get_format(outFormat))
+    if outFormat is None and detect_format(outFile) is None:
+        sys.exit("the format of {} is unknown, use the '--to' option\n".format(outFile))
+    outFormat = outFormat or detect_format(outFile).name
+    outFile = compressed_filename(outFile, get_format(outFormat), compress)
+    result = convert_job((inFile, outFile, inFormat or detect_format(inFile).name, outFormat, compress, useCache, selection))
+    print("\nScenario conversion ({}):".format(outFormat))
+    print_result(result)
+    if result[4] is not None:
+        sys.exit(1)
+    print("\n{} created successfully\n".format(outFile))
+
+if __name__ == '__main__':
+    main()
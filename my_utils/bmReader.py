@@ -0,0 +1,140 @@
+from array import array
+import gzip
+import numpy as np
+from my_utils.locationEngine import LocationEngine
+from my_utils.scnStats import compute_stats
+from my_utils.profiler import g_profiler
+
+# Columnar in-memory representation of a BonnMotion scenario: waypoint times (W,) and coordinates (W, D)
+# stored as float64 columns plus a per-node offset index (N+1,), waypoints of node n are in offsets[n]:offsets[n+1]
+# nodeIds holds the node number in the file of each stored node (nodes with malformed lines are skipped while
+# reading) and params the contents of the .params file when loaded through scnCache.load_scenario
+# The statistics index (scnStats.ScenarioStats) is computed on first use, or loaded from the binary cache
+class BmScenario:
+    def __init__ (self, times, coords, offsets, is3D, nodeIds=None, params=None):
+        self.times = times
+        self.coords = coords
+        self.offsets = offsets
+        self.is3D = is3D
+        self.node_count = len(offsets) - 1
+        self.dims = coords.shape[1]
+        self.node_ids = np.arange(self.node_count, dtype=np.int64) if nodeIds is None else nodeIds
+        self.params = {} if params is None else params
+        self.file_node_count = self.node_count # number of node lines in the file, including skipped ones
+        self.stats = None
+    @property
+    def x(self):
+        return self.coords[:, 0]
+    @property
+    def y(self):
+        return self.coords[:, 1]
+    @property
+    def z(self):
+        return self.coords[:, 2] if self.dims == 3 else None
+    def get_node(self, n):
+        return self.times[self.offsets[n]:self.offsets[n+1]], self.coords[self.offsets[n]:self.offsets[n+1]]
+    def iter_nodes(self):
+        # yields (n, times, coords) where n is the node number in the file, as MovementsReader does
+        for i in range(self.node_count):
+            yield (int(self.node_ids[i]),) + self.get_node(i)
+    def get_stats(self):
+        if self.stats is None:
+            self.stats = compute_stats(self.times, self.coords, self.offsets)
+        return self.stats
+    def get_engine(self, dims=None):
+        # Interpolation engine over the first 'dims' coordinates (all of them by default)
+        return LocationEngine(self.times, self.coords[:, :dims], self.offsets)
+
+# Streaming reader of a .movements file, iterating yields (n, times, coords) one node at a time where n
+# is the node number in the file (nodes whose line is malformed are reported and skipped)
+# The file is opened and its header read on creation, so is3D is known before iterating. Files with a
+# '.gz' extension (e.g. compressed converter output) are decompressed on the fly
+class MovementsReader:
+    def __init__ (self, filename):
+        self.filename = filename
+        self.node_count = 0
+        self.__bmFile = gzip.open(filename, 'rt') if filename.endswith(".gz") else open(filename, 'r')
+        self.__firstLine = self.__bmFile.readline()
+        self.is3D = self.__firstLine.strip() == "#3D"
+        if self.is3D:
+            self.__firstLine = self.__bmFile.readline()
+    def __iter__(self):
+        with self.__bmFile as bmFile:
+            wpSize = 4 if self.is3D else 3
+            bmLine = self.__firstLine
+            n = -1
+            while (bmLine):
+                bmLine = bmLine.strip()
+                if bmLine == "" or bmLine.startswith('#'):
+                    bmLine = bmFile.readline()
+                    continue
+                n += 1
+                self.node_count = n + 1
+                waypoints = parse_waypoints(n, bmLine.split(), wpSize)
+                if waypoints is not None:
+                    yield n, waypoints[:, 0], waypoints[:, 1:]
+                bmLine = bmFile.readline()
+    def close(self):
+        self.__bmFile.close()
+
+# Converts the tokens of a node line into a (waypoints, wpSize) array, returns None if the line is malformed
+def parse_waypoints(n, tokens, wpSize):
+    if len(tokens) == 0 or (len(tokens) % wpSize) != 0:
+        print ("error at node {}: line does not contain correct number of values ({})...node skipped".format(n, len(tokens)) )
+        return None
+    try:
+        return np.array(tokens, dtype=np.float64).reshape(-1, wpSize)
+    except ValueError:
+        # Slow path, only the waypoints containing invalid numbers are dropped
+        waypoints = []
+        for i in range(0, len(tokens), wpSize):
+            try:
+                waypoints.append([float(token) for token in tokens[i:i+wpSize]])
+            except ValueError as e:
+                print ("error at node {}: invalid number:{}...waypoint skipped".format(n, str(e).split(':')[-1] ) )
+        if len(waypoints) == 0:
+            return None
+        return np.array(waypoints, dtype=np.float64)
+
+# Generator mode: yields (n, times, coords) for each node of a .movements file without loading the whole scenario
+def iter_nodes(filename):
+    return iter(MovementsReader(filename))
+
+# Reads a whole .movements file into a BmScenario, columns are accumulated in compact float buffers
+def read_movements(filename):
+    with g_profiler.stage("parse movements"):
+        return _read_movements(filename)
+
+def _read_movements(filename):
+    reader = MovementsReader(filename)
+    times = array('d')
+    coords = array('d')
+    counts = array('q')
+    nodeIds = array('q')
+    for n, nodeTimes, nodeCoords in reader:
+        times.frombytes(nodeTimes.tobytes())
+        coords.frombytes(np.ascontiguousarray(nodeCoords).tobytes())
+        counts.append(len(nodeTimes))
+        nodeIds.append(n)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(counts, dtype=np.int64), out=offsets[1:])
+    dims = 3 if reader.is3D else 2
+    scenario = BmScenario(np.frombuffer(times, dtype=np.float64), np.frombuffer(coords, dtype=np.float64).reshape(-1, dims), offsets, reader.is3D,
+                          np.frombuffer(nodeIds, dtype=np.int64))
+    scenario.file_node_count = reader.node_count
+    g_profiler.count("waypoints parsed", len(times))
+    return scenario
+
+# Reads a BonnMotion .params file into a dictionary, numeric values are converted to float
+def read_params(filename):
+    params = {}
+    with open(filename, 'r') as paramsFile:
+        for line in paramsFile:
+            keyValue = line.strip().split('=', 1)
+            if len(keyValue) != 2 or keyValue[0].startswith('#'):
+                continue
+            try:
+                params[keyValue[0]] = float(keyValue[1])
+            except ValueError:
+                params[keyValue[0]] = keyValue[1]
+    return params
@@ -0,0 +1,56 @@
+import gzip
+import numpy as np
+from my_utils.profiler import g_profiler
+
+# Buffered output stage shared by the converters. Formatted text is accumulated in memory and written
+# in large chunks (optionally as a gzip stream) instead of issuing one write per line.
+class BulkWriter:
+    def __init__ (self, filename, compress=False, bufferSize=1 << 22):
+        self.filename = filename
+        self.bytes_written = 0
+        self.__bufferSize = bufferSize
+        self.__buffer = []
+        self.__buffered = 0
+        if compress:
+            self.__file = gzip.open(filename, 'wb', compresslevel=6)
+        else:
+            self.__file = open(filename, 'wb')
+    def __enter__(self):
+        return self
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+    def write(self, text):
+        self.__buffer.append(text)
+        self.__buffered += len(text)
+        if self.__buffered >= self.__bufferSize:
+            self.flush()
+    def flush(self):
+        if self.__buffer:
+            data = "".join(self.__buffer).encode()
+            with g_profiler.stage("write output"):
+                self.__file.write(data)
+            if g_profiler.enabled:
+                g_profiler.count("bytes written", len(data))
+                g_profiler.count("lines written", data.count(b"\n"))
+            self.bytes_written += len(data)
+            self.__buffer = []
+            self.__buffered = 0
+    def close(self):
+        self.flush()
+        self.__file.close()
+
+# Output filename, a '.gz' extension is appended when the output is compressed
+def output_filename(filename, compress):
+    return filename + ".gz" if compress and not filename.endswith(".gz") else filename
+
+# Formats the waypoints of a batch of nodes as .movements lines ("t x y [z] t x y [z] ..."). Times and
+# coordinates are interleaved as NumPy columns and converted to text in a single pass, 'offsets' delimits
+# the waypoints of each node
+def format_movements_lines(times, coords, offsets):
+    wpSize = coords.shape[1] + 1
+    values = list(map(str, np.column_stack((times, coords)).ravel().tolist()))
+    lines = []
+    for o0, o1 in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        lines.append(" ".join(values[o0*wpSize:o1*wpSize]))
+        lines.append("\n")
+    return "".join(lines)
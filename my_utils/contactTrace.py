@@ -0,0 +1,271 @@
+import itertools
+import numpy as np
+from my_utils.scnCache import load_scenario
+
+# Exact contact extraction for a radio range R. Every node moves along a straight line between two of its
+# waypoints, so while two such segments of a node pair overlap in time the distance of the pair is the
+# square root of a quadratic and the times where it equals R are found analytically. The work is done per
+# node segment: the time is divided in buckets (the time a typical node takes to cover R), segments are cut
+# at the bucket boundaries and in pieces moving at most R, and every piece is put in the grid cell of the
+# center of its bounding box within its bucket. Only the pieces of a bucket in the same or adjacent cells
+# are compared, so the cost follows the number of segments and of neighbours of each node instead of the
+# number of waypoint times times the number of nodes.
+# Contacts are keyed by the pair index i*N+j (i < j, engine node indexes).
+
+class ContactTracer:
+    def __init__ (self, engine, radius, chunkPieces=1 << 21, batchPairs=1 << 22):
+        self.engine = engine
+        self.radius = float(radius)
+        self.node_count = engine.node_count
+        self.dims = engine.dims
+        self.__chunkPieces = chunkPieces
+        self.__batchPairs = batchPairs
+        times, coords, offsets = engine.times, engine.coords, engine.offsets
+        counts = np.diff(offsets)
+        nodes = np.repeat(np.arange(self.node_count, dtype=np.int64), counts)
+        # moving segments between consecutive waypoints of a node (waypoints sharing a time are jumps), nodes
+        # hold their first location before their first waypoint and their last location after the last one
+        k = np.flatnonzero((nodes[1:] == nodes[:-1]) & (times[1:] > times[:-1]))
+        first = offsets[:-1][counts > 0]
+        last = offsets[1:][counts > 0] - 1
+        holds = len(first)
+        self.__segNodes = np.concatenate((nodes[k], nodes[first], nodes[last]))
+        self.__segStart = np.concatenate((times[k], np.full(holds, -np.inf), times[last]))
+        self.__segEnd = np.concatenate((times[k+1], times[first], np.full(holds, np.inf)))
+        # the location of a segment at time t is segLoc + segVel * (t - segRef)
+        self.__segRef = np.concatenate((times[k], times[first], times[last]))
+        self.__segLoc = np.concatenate((coords[k], coords[first], coords[last]))
+        self.__segVel = np.zeros((len(k) + 2 * holds, self.dims))
+        self.__segVel[:len(k)] = (coords[k+1] - coords[k]) / (times[k+1] - times[k])[:, None]
+        self.__segSpeed = np.sqrt(np.sum(self.__segVel**2, axis=1))
+        moving = self.__segSpeed[self.__segSpeed > 0]
+        self.__bucket = self.radius / float(np.median(moving)) if len(moving) > 0 else np.inf
+        # offsets of half of the adjacent cells, the other half is reached from the neighbours
+        self.__neighbours = [offset for offset in itertools.product((-1, 0, 1), repeat=self.dims) if offset > (0,) * self.dims]
+
+    # Location at times t of the segments 'seg'
+    def __locations(self, seg, t):
+        return self.__segLoc[seg] + self.__segVel[seg] * (t - self.__segRef[seg])[:, None]
+
+    # Pieces of the segments within the buckets 'edges' as (segment, bucket, start time, end time) arrays.
+    # Adjacent pieces share their boundary time, so their locations there are identical
+    def __pieces(self, edges):
+        seg = np.flatnonzero((self.__segStart < edges[-1]) & (self.__segEnd > edges[0]))
+        ta = np.maximum(self.__segStart[seg], edges[0])
+        tb = np.minimum(self.__segEnd[seg], edges[-1])
+        # parts of the segments within each bucket
+        firstBucket = np.searchsorted(edges, ta, side='right') - 1
+        buckets = np.searchsorted(edges, tb, side='left') - firstBucket
+        part = np.repeat(np.arange(len(seg)), buckets)
+        bucket = np.arange(len(part)) - np.repeat(np.cumsum(buckets) - buckets, buckets) + firstBucket[part]
+        pa = np.maximum(edges[bucket], ta[part])
+        pb = np.minimum(edges[bucket + 1], tb[part])
+        # parts moving more than R are cut again
+        cuts = np.maximum(np.ceil(self.__segSpeed[seg[part]] * (pb - pa) / self.radius), 1).astype(np.int64)
+        piece = np.repeat(np.arange(len(part)), cuts)
+        k = np.arange(len(piece)) - np.repeat(np.cumsum(cuts) - cuts, cuts)
+        span = (pb - pa)[piece]
+        start = pa[piece] + span * (k / cuts[piece])
+        end = np.where(k + 1 == cuts[piece], pb[piece], pa[piece] + span * ((k + 1) / cuts[piece]))
+        return seg[part[piece]], bucket[piece], start, end
+
+    # Merged contacts of the chunk of buckets 'edges' as (keys, start, end) arrays sorted by key and start
+    def chunk_contacts(self, edges):
+        seg, bucket, start, end = self.__pieces(edges)
+        pieceStart = self.__locations(seg, start)
+        pieceEnd = self.__locations(seg, end)
+        lo = np.minimum(pieceStart, pieceEnd)
+        hi = np.maximum(pieceStart, pieceEnd)
+        # pieces move at most R, the box centers of two pieces within range of each other are at most 2R
+        # apart on every axis: with cells of 2R they are in the same or in adjacent cells. Cells are shifted
+        # so that adjacent cells never wrap around in the linear keys
+        cells = np.floor((lo + hi) / (4 * self.radius)).astype(np.int64)
+        cells -= cells.min(axis=0, initial=0) - 1
+        sizes = cells.max(axis=0, initial=0) + 2
+        keys = bucket.astype(np.int64)
+        for axis in range(self.dims):
+            keys = keys * sizes[axis] + cells[:, axis]
+        # pieces sorted by key, the box bounds as one array per axis
+        order = np.argsort(keys, kind='stable')
+        keys, seg, start, end = keys[order], seg[order], start[order], end[order]
+        lo, hi = np.ascontiguousarray(lo[order].T), np.ascontiguousarray(hi[order].T)
+        # every piece is compared with the following pieces of its cell and with the pieces of half of the
+        # adjacent cells, as ranges of the sorted pieces
+        indexes = np.arange(len(keys))
+        rangeFirst = [indexes]
+        rangeBegin = [indexes + 1]
+        rangeCount = [np.searchsorted(keys, keys, side='right') - indexes - 1]
+        for offset in self.__neighbours:
+            delta = sum(int(o) * int(np.prod(sizes[axis+1:])) for axis, o in enumerate(offset))
+            begin = np.searchsorted(keys, keys + delta, side='left')
+            rangeFirst.append(indexes)
+            rangeBegin.append(begin)
+            rangeCount.append(np.searchsorted(keys, keys + delta, side='right') - begin)
+        rangeFirst, rangeBegin, rangeCount = (np.concatenate(column) for column in (rangeFirst, rangeBegin, rangeCount))
+        cumulative = np.cumsum(rangeCount)
+        found = []
+        r0 = 0
+        while r0 < len(rangeCount):
+            base = cumulative[r0 - 1] if r0 > 0 else 0
+            r1 = max(r0 + 1, int(np.searchsorted(cumulative, base + self.__batchPairs, side='right')))
+            counts = rangeCount[r0:r1]
+            total = int(counts.sum())
+            if total > 0:
+                first = np.repeat(rangeFirst[r0:r1], counts)
+                second = np.arange(total) - np.repeat(np.cumsum(counts) - counts - rangeBegin[r0:r1], counts)
+                found.append(self.__pair_contacts(first, second, seg, start, end, lo, hi))
+            r0 = r1
+        if not found:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        keys, contactStart, contactEnd = (np.concatenate(column) for column in zip(*found))
+        return merge_intervals(keys, contactStart, contactEnd)
+
+    # Contact intervals of candidate piece pairs (pieces p and q) as (keys, start, end) arrays. The cheap
+    # tests (boxes within R on every axis, different nodes, overlapping times) are applied one at a time
+    def __pair_contacts(self, p, q, seg, start, end, lo, hi):
+        for axis in range(len(lo)):
+            keep = (lo[axis][p] - self.radius <= hi[axis][q]) & (lo[axis][q] - self.radius <= hi[axis][p])
+            p, q = p[keep], q[keep]
+        nodes = self.__segNodes[seg]
+        a = np.maximum(start[p], start[q])
+        b = np.minimum(end[p], end[q])
+        keep = (nodes[p] != nodes[q]) & (a < b)
+        p, q, a, b = p[keep], q[keep], a[keep], b[keep]
+        d0 = self.__locations(seg[p], a) - self.__locations(seg[q], a)
+        d1 = self.__locations(seg[p], b) - self.__locations(seg[q], b)
+        inRange, contactStart, contactEnd = range_intervals(d0, d1, a, b, self.radius)
+        i, j = nodes[p[inRange]], nodes[q[inRange]]
+        return np.minimum(i, j) * self.node_count + np.maximum(i, j), contactStart[inRange], contactEnd[inRange]
+
+    # Bucket edges of the chunks of [t0, t1], a chunk holds about 'chunkPieces' pieces
+    def __chunks(self, t0, t1):
+        chunkBuckets = max(1, self.__chunkPieces // (2 * max(1, self.node_count)))
+        chunkCount = max(1, int(np.ceil((t1 - t0) / (self.__bucket * chunkBuckets))))
+        bounds = [t0 + (t1 - t0) * c / chunkCount for c in range(chunkCount)] + [t1]
+        return [np.linspace(c0, c1, max(1, int(np.ceil((c1 - c0) / self.__bucket))) + 1) for c0, c1 in zip(bounds[:-1], bounds[1:])]
+
+    # Contacts during the window [t0, t1] as (keys, start, end) arrays, the pairs still in range at t1 end at t1
+    def trace(self, t0, t1):
+        found = []
+        openKeys = np.zeros(0, dtype=np.int64)
+        openStarts = np.zeros(0)
+        for edges in self.__chunks(t0, t1):
+            c0, c1 = edges[0], edges[-1]
+            keys, start, end = self.chunk_contacts(edges)
+            fromStart = start == c0
+            toEnd = end == c1
+            # contacts open at c0 go on when the pair is in range from the start of the chunk
+            continued = fromStart & np.isin(keys, openKeys)
+            start[continued] = openStarts[np.searchsorted(openKeys, keys[continued])]
+            ended = ~np.isin(openKeys, keys[continued])
+            found.append((openKeys[ended], openStarts[ended], np.full(np.count_nonzero(ended), c0)))
+            found.append((keys[~toEnd], start[~toEnd], end[~toEnd]))
+            order = np.argsort(keys[toEnd])
+            openKeys, openStarts = keys[toEnd][order], start[toEnd][order]
+        found.append((openKeys, openStarts, np.full(len(openKeys), float(t1))))
+        keys, start, end = (np.concatenate(column) for column in zip(*found))
+        order = np.lexsort((keys, start))
+        return keys[order], start[order], end[order]
+
+# Times within [a, b] where |d0 + (d1 - d0)*u| <= R for u in [0, 1], d0 and d1 being the (P, D) differences
+# of the pair locations at a and b. Returns (inRange, start, end) arrays
+def range_intervals(d0, d1, a, b, radius):
+    dv = d1 - d0
+    qa = np.sum(dv**2, axis=1)
+    qb = 2 * np.sum(d0*dv, axis=1)
+    qc = np.sum(d0**2, axis=1) - radius**2
+    fromStart = qc <= 0
+    toEnd = np.sum(d1**2, axis=1) <= radius**2
+    disc = qb**2 - 4*qa*qc
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # numerically stable roots of the quadratic
+        q = -0.5 * (qb + np.copysign(np.sqrt(np.maximum(disc, 0)), qb))
+        r1 = q / qa
+        r2 = qc / q
+    u1 = np.where(fromStart, 0.0, np.fmax(np.fmin(r1, r2), 0.0))
+    u2 = np.where(toEnd, 1.0, np.fmin(np.fmax(r1, r2), 1.0))
+    # relative motion of zero length: always or never in range
+    static = qa == 0
+    u1[static] = 0.0
+    u2[static] = np.where(fromStart[static], 1.0, 0.0)
+    inRange = ((disc >= 0) | fromStart | toEnd) & (u2 > u1)
+    start = np.where(fromStart, a, a + u1 * (b - a))
+    end = np.where(toEnd, b, a + u2 * (b - a))
+    return inRange, start, end
+
+# Joins the touching intervals of each key, returns (keys, start, end) sorted by key and start. The pieces of
+# a node do not overlap in time, so neither do the intervals of a key: an interval continues the previous
+# one of its key only when it starts where that one ends
+def merge_intervals(keys, start, end):
+    order = np.lexsort((start, keys))
+    keys, start, end = keys[order], start[order], end[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (start[1:] > end[:-1])
+    groups = np.flatnonzero(first)
+    last = np.append(groups[1:], len(keys)) - 1
+    return keys[groups], start[groups], end[last]
+
+# Times where node motions change: all the waypoint times within the scenario time span
+def scenario_breakpoints(scenario):
+    stats = scenario.get_stats()
+    times = np.unique(scenario.times)
+    return times[(times >= stats.start_time) & (times <= stats.end_time)]
+
+# Splits the breakpoints in 'windowCount' (start, end) windows of consecutive intervals, adjacent windows
+# share a breakpoint
+def time_windows(breakpoints, windowCount):
+    intervals = len(breakpoints) - 1
+    windowCount = max(1, min(windowCount, intervals))
+    bounds = np.linspace(0, intervals, windowCount + 1).round().astype(np.int64).tolist()
+    return [(float(breakpoints[w0]), float(breakpoints[w1])) for w0, w1 in zip(bounds[:-1], bounds[1:]) if w1 > w0]
+
+# Joins the contacts of consecutive time windows (in order): a contact ending at the end of a window and
+# starting at the beginning of the next one is the same contact. Yields (ups, closed) for each window where
+# ups are the (keys, start) of the contacts starting in the window and closed the (keys, start, end) of the
+# contacts that are over, the contacts in range at the end of the last window end at that time
+def stitch_windows(windowResults):
+    carryKeys = np.zeros(0, dtype=np.int64)
+    carryStarts = np.zeros(0)
+    lastEnd = None
+    for windowStart, windowEnd, (keys, start, end) in windowResults:
+        continued = (start == windowStart) & np.isin(keys, carryKeys)
+        start = start.copy()
+        start[continued] = carryStarts[np.searchsorted(carryKeys, keys[continued])]
+        ended = ~np.isin(carryKeys, keys[continued])
+        atEnd = end == windowEnd
+        closed = (np.concatenate((carryKeys[ended], keys[~atEnd])), np.concatenate((carryStarts[ended], start[~atEnd])),
+                  np.concatenate((np.full(np.count_nonzero(ended), windowStart), end[~atEnd])))
+        order = np.argsort(closed[2], kind='stable')
+        yield (keys[~continued], start[~continued]), tuple(column[order] for column in closed)
+        order = np.argsort(keys[atEnd])
+        carryKeys, carryStarts = keys[atEnd][order], start[atEnd][order]
+        lastEnd = windowEnd
+    if len(carryKeys) > 0:
+        yield (np.zeros(0, dtype=np.int64), np.zeros(0)), (carryKeys, carryStarts, np.full(len(carryKeys), lastEnd))
+
+# Text of the contacts of a window: CSV lines "node1,node2,start,end,duration" for the closed contacts, or
+# ONE contact trace events "time CONN node1 node2 up|down" sorted by time
+def format_contacts(traceFormat, ups, closed, nodeCount, nodeIds):
+    if traceFormat == 'csv':
+        keys, start, end = closed
+        i, j = nodeIds[keys // nodeCount], nodeIds[keys % nodeCount]
+        return "".join("{},{},{},{},{}\n".format(*row) for row in zip(i.tolist(), j.tolist(), start.tolist(), end.tolist(), (end - start).tolist()))
+    upKeys, upTimes = ups
+    downKeys, _, downTimes = closed
+    keys = np.concatenate((downKeys, upKeys))
+    times = np.concatenate((downTimes, upTimes))
+    states = np.array(["down"] * len(downKeys) + ["up"] * len(upKeys))
+    order = np.argsort(times, kind='stable')
+    i, j = nodeIds[keys[order] // nodeCount], nodeIds[keys[order] % nodeCount]
+    return "".join("{} CONN {} {} {}\n".format(*row) for row in zip(times[order].tolist(), i.tolist(), j.tolist(), states[order].tolist()))
+
+# Per-process tracer, set up once by init_worker
+g_tracer = None
+
+def init_worker(movementsFile, radius, dims, useCache):
+    global g_tracer
+    scenario = load_scenario(movementsFile, useCache=useCache)
+    g_tracer = ContactTracer(scenario.get_engine(dims), radius)
+
+def trace_window(window):
+    return window[0], window[1], g_tracer.trace(*window)
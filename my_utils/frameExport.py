@@ -0,0 +1,130 @@
+import multiprocessing, os, shutil, subprocess, time
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from my_utils.scnCache import load_scenario
+from my_utils.scnSlice import load_slice
+from my_utils.scnFigure import ScenarioFigure, figure_size
+from my_utils.scnStats import plot_extents
+from my_utils.profiler import g_profiler
+
+# Headless export of a scenario animation to a GIF or MP4 file. The frame timeline is split in chunks that
+# are rendered by a pool of worker processes with the Agg canvas, each worker draws the static part of the
+# figure once and then only the node artists of every frame. Raw RGBA frames are streamed to the encoder
+# in frame order.
+FRAMES_PER_CHUNK = 8
+
+# Per-process rendering state, set up once by init_worker
+g_worker = None
+
+class FrameRenderer:
+    # figOptions holds the keyword arguments of ScenarioFigure (drawLabel, level of detail settings), selection
+    # the nodes, t0 and t1 arguments of scnSlice.load_slice when only a slice of the scenario is shown
+    def __init__ (self, movementsFile, paramsFile, scnName, scn3D, figOptions, dpi, useCache, selection=None):
+        if selection is not None:
+            scenario = load_slice(movementsFile, paramsFile, useCache=useCache, **selection)
+        else:
+            scenario = load_scenario(movementsFile, paramsFile, useCache)
+        self.engine = scenario.get_engine(3 if scn3D else 2)
+        figParams = plot_extents(scenario.params, scenario.get_stats())
+        fig = Figure(figsize=figure_size(figParams, scn3D), dpi=dpi)
+        self.canvas = FigureCanvasAgg(fig)
+        self.scnFigure = ScenarioFigure(fig, scnName, figParams, scn3D, scenario.node_count, animated=True, nodeIds=scenario.node_ids, **figOptions)
+        # Everything except the animated artists is rendered once and restored on each frame
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(fig.bbox)
+        self.size = self.canvas.get_width_height()
+    def render(self, frameTimes):
+        frames = []
+        ax = self.scnFigure.ax
+        with g_profiler.stage("interpolate"):
+            blockPositions = self.engine.positions_block(frameTimes)
+        for frameTime, loctns in zip(frameTimes.tolist(), blockPositions):
+            if g_profiler.enabled:
+                start = time.perf_counter()
+            self.canvas.restore_region(self.background)
+            for artist in self.scnFigure.draw_frame(loctns, frameTime):
+                if hasattr(artist, 'do_3d_projection'):
+                    artist.do_3d_projection()
+                ax.draw_artist(artist)
+            frames.append(bytes(self.canvas.buffer_rgba()))
+            if g_profiler.enabled:
+                g_profiler.add_frame_time(time.perf_counter() - start)
+        return frames
+
+def init_worker(*rendererArgs):
+    global g_worker
+    g_worker = FrameRenderer(*rendererArgs)
+
+def render_chunk(frameTimes):
+    return g_worker.render(frameTimes)
+
+# Frame sink writing raw RGBA frames to an ffmpeg process (MP4, or GIF when ffmpeg is available)
+class FFmpegSink:
+    def __init__ (self, outFile, size, fps):
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "{}x{}".format(*size),
+                   "-r", str(fps), "-i", "-"]
+        if outFile.lower().endswith(".gif"):
+            command += ["-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse"]
+        else:
+            # yuv420p requires even dimensions
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p"]
+        self.process = subprocess.Popen(command + [outFile], stdin=subprocess.PIPE)
+    def write(self, frame):
+        self.process.stdin.write(frame)
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg exited with code {}".format(self.process.returncode))
+
+# Frame sink used for GIF files when ffmpeg is not installed, frames are kept (palettized) until closing
+class PillowGifSink:
+    def __init__ (self, outFile, size, fps):
+        from PIL import Image
+        self.image = Image
+        self.outFile = outFile
+        self.size = size
+        self.duration = 1000 / fps
+        self.frames = []
+    def write(self, frame):
+        # method 2 is the fast octree quantizer, plenty for the few colors of a scenario plot
+        self.frames.append(self.image.frombytes("RGBA", self.size, frame).convert("RGB").quantize(method=2))
+    def close(self):
+        if self.frames:
+            self.frames[0].save(self.outFile, save_all=True, append_images=self.frames[1:], duration=self.duration, loop=0)
+
+def open_sink(outFile, size, fps):
+    if shutil.which("ffmpeg") is not None:
+        return FFmpegSink(outFile, size, fps)
+    if outFile.lower().endswith(".gif"):
+        return PillowGifSink(outFile, size, fps)
+    raise RuntimeError("ffmpeg is required to export {}".format(outFile))
+
+def write_frames(sink, frames):
+    with g_profiler.stage("encode"):
+        for frame in frames:
+            sink.write(frame)
+    g_profiler.count("frames encoded", len(frames))
+
+# Renders the frames at 'frameTimes' and encodes them into 'outFile' using 'jobs' worker processes
+def export_animation(outFile, movementsFile, paramsFile, scnName, scn3D, figOptions, frameTimes, fps=20, dpi=80, jobs=None, useCache=True, selection=None):
+    rendererArgs = (movementsFile, paramsFile, scnName, scn3D, figOptions, dpi, useCache, selection)
+    jobs = jobs or os.cpu_count() or 1
+    chunks = [frameTimes[f:f+FRAMES_PER_CHUNK] for f in range(0, len(frameTimes), FRAMES_PER_CHUNK)]
+    # The size of the frames is taken from a renderer in this process, which also renders when jobs == 1
+    init_worker(*rendererArgs)
+    sink = open_sink(outFile, g_worker.size, fps)
+    try:
+        if jobs > 1 and len(chunks) > 1:
+            # 'fork' avoids re-running the calling script in the workers where it is available
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            with context.Pool(jobs, initializer=init_worker, initargs=rendererArgs) as pool:
+                for frames in pool.imap(render_chunk, chunks):
+                    write_frames(sink, frames)
+        else:
+            for chunk in chunks:
+                write_frames(sink, render_chunk(chunk))
+    finally:
+        with g_profiler.stage("encode"):
+            sink.close()
+    return len(frameTimes)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from my_utils.locationEngine import frame_times
+from my_utils.profiler import g_profiler
+
+# Random access source of animation frames. Node locations for any time are computed by the interpolation
+# engine (a binary search per node) and the frames of the current timeline are kept in an LRU cache. On a
+# cache miss a block of the following frames is computed at once, which makes sequential playback cheap.
+# The timeline spans 'timeRange' (start, end) when given, otherwise the course of the first node
+class FrameSource:
+    def __init__ (self, engine, interval, timeRange=None, cacheBytes=1 << 28, blockElements=1 << 20):
+        self.engine = engine
+        if timeRange is None:
+            timeRange = (engine.get_start_time(), engine.get_end_time())
+        self.start_time = float(timeRange[0])
+        self.end_time = float(timeRange[1])
+        frameElements = max(1, engine.node_count * engine.dims)
+        self.__cacheSize = max(1, cacheBytes // (frameElements * 8))
+        self.__blockSize = max(1, min(self.__cacheSize, blockElements // frameElements))
+        self.__cache = OrderedDict()
+        self.set_interval(interval)
+
+    # Changes the scenario time between frames, cached frames are kept since they are indexed by time
+    def set_interval(self, interval):
+        self.interval = interval
+        self.times = frame_times(self.start_time, self.end_time, interval)
+        self.frame_count = len(self.times)
+
+    def time_at(self, f):
+        return float(self.times[f])
+
+    # Index of the frame closest to time t
+    def frame_at(self, t):
+        return int(min(max(round((t - self.start_time) / self.interval), 0), self.frame_count - 1))
+
+    def positions_at(self, t):
+        return self.engine.positions(t)
+
+    def get_frame(self, f):
+        t = self.time_at(f)
+        positions = self.__cache.get(t)
+        if positions is None:
+            blockTimes = self.times[f:f+self.__blockSize]
+            with g_profiler.stage("interpolate"):
+                blockPositions = self.engine.positions_block(blockTimes)
+            g_profiler.count("frames generated", len(blockTimes))
+            for blockTime, positions in zip(blockTimes.tolist(), blockPositions):
+                self.__cache[blockTime] = positions
+                self.__cache.move_to_end(blockTime)
+            while len(self.__cache) > self.__cacheSize:
+                self.__cache.popitem(last=False)
+            positions = self.__cache[t]
+        else:
+            self.__cache.move_to_end(t)
+        return positions
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, f):
+        return self.get_frame(f)
+
+# Playback state over a FrameSource: iterating yields (time, positions) once per animation tick, advancing
+# one frame unless paused. Seeking, stepping and speed changes can be requested at any time (e.g. from
+# keyboard or slider callbacks) and are applied on the next tick.
+# With 'follow' the playback waits at the last frame instead of pausing, for timelines that keep growing
+class Playback:
+    def __init__ (self, frameSource, loop=False, follow=False):
+        self.source = frameSource
+        self.loop = loop
+        self.follow = follow
+        self.paused = False
+        self.frame = 0
+        self.__advance = False # the first tick shows frame 0
+    def __iter__(self):
+        while True:
+            if self.__advance and not self.paused:
+                if self.frame < self.source.frame_count - 1:
+                    self.frame += 1
+                elif self.loop:
+                    self.frame = 0
+                elif not self.follow:
+                    self.paused = True
+            self.__advance = True
+            yield self.source.time_at(self.frame), self.source.get_frame(self.frame)
+    def __hold(self):
+        # the frame set by a seek is shown as is on the next tick
+        self.__advance = False
+    def get_time(self):
+        return self.source.time_at(self.frame)
+    def seek(self, f):
+        self.frame = int(min(max(f, 0), self.source.frame_count - 1))
+        self.__hold()
+    def seek_time(self, t):
+        self.seek(self.source.frame_at(t))
+    def step(self, frames):
+        self.seek(self.frame + frames)
+    def toggle_pause(self):
+        self.paused = not self.paused
+    # Replaces the frame source (e.g. when more of the scenario has been read), the current time is kept
+    def set_source(self, frameSource):
+        t = self.get_time()
+        self.source = frameSource
+        self.frame = frameSource.frame_at(t)
+    # Scales the scenario time between frames (the real time between frames is not changed)
+    def set_interval(self, interval):
+        t = self.get_time()
+        self.source.set_interval(interval)
+        self.seek_time(t)
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+
+# Vectorized interpolation of node locations from packed BonnMotion waypoints.
+# All waypoints are stored in flat arrays: 'times' (W,), 'coords' (W, D) and 'offsets' (N+1,) so
+# that the waypoints of node n are times[offsets[n]:offsets[n+1]]. Waypoint times of each node
+# are expected in non-decreasing order, as written by BonnMotion.
+class LocationEngine:
+    def __init__ (self, times, coords, offsets):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.node_count = len(self.offsets) - 1
+        self.dims = self.coords.shape[1]
+        self.__counts = np.diff(self.offsets)
+        self.__first = self.offsets[:-1]
+        self.__last = self.offsets[1:] - 1
+        # Each waypoint time is replaced by its rank among all distinct times, the (node, rank) pair is then
+        # packed in a single integer key that is sorted across the whole array and can be searched exactly
+        self.__uniqueTimes, ranks = np.unique(self.times, return_inverse=True)
+        self.__stride = len(self.__uniqueTimes) + 1
+        nodeIds = np.repeat(np.arange(self.node_count, dtype=np.int64), self.__counts)
+        self.__keys = nodeIds * self.__stride + ranks.reshape(-1)
+        # Velocity of the segment starting at each waypoint, zero for the last waypoint of a node and
+        # for waypoints sharing the same time
+        self.__velocities = np.zeros_like(self.coords)
+        if len(self.times) > 1:
+            timeSpan = np.diff(self.times)
+            moving = (timeSpan > 0) & (nodeIds[1:] == nodeIds[:-1])
+            self.__velocities[:-1][moving] = np.diff(self.coords, axis=0)[moving] / timeSpan[moving, None]
+
+    def get_start_time(self):
+        return self.times[self.__first[0]]
+
+    def get_end_time(self):
+        return self.times[self.__last[0]]
+
+    def __segments(self, t):
+        # Index of the waypoint each node is moving away from at time(s) t, shape t.shape + (N,)
+        t = np.asarray(t, dtype=np.float64)
+        nodeKeys = np.arange(self.node_count, dtype=np.int64) * self.__stride
+        q = np.searchsorted(self.__uniqueTimes, t, side='right')
+        # number of waypoints of each node with a time lower or equal than t
+        passed = np.searchsorted(self.__keys, nodeKeys + q[..., None], side='left') - self.__first
+        segment = self.__first + np.clip(passed - 1, 0, None)
+        hold = (passed >= self.__counts) | (self.__counts == 1)
+        return np.where(hold, self.__last, segment)
+
+    def positions(self, t):
+        # Locations of all nodes at time t as an (N, D) array
+        index = self.__segments(t)
+        return self.coords[index] + self.__velocities[index] * (t - self.times[index])[:, None]
+
+    def positions_block(self, frameTimes):
+        # Locations of all nodes at each of the given times as an (M, N, D) array
+        frameTimes = np.asarray(frameTimes, dtype=np.float64)
+        index = self.__segments(frameTimes)
+        elapsed = frameTimes[:, None] - self.times[index]
+        return self.coords[index] + self.__velocities[index] * elapsed[..., None]
+
+# Times of the frames generated every 'interval' seconds from 'start', accumulated the same way as
+# the original frame loop so that results are identical. The timeline covers [start, end]
+def frame_times(start, end, interval):
+    steps = np.full(max(0, math.ceil((end - start) / interval)) + 1, interval, dtype=np.float64)
+    steps[0] = start
+    return np.cumsum(steps)
@@ -1,30 +1,55 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+
 class NodeCourse:
     def __init__ (self, times, locations):
-        self.__times = times
-        self.__locations = locations
+        # The timeline is kept sorted (stable, so repeated times keep their original order) and array-backed
+        times = np.asarray(times, dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        self.__times = times[order]
+        self.__locations = np.asarray(locations, dtype=np.float64).reshape(len(times), -1)[order]
+        self.__timeList = self.__times.tolist()
     def get_location(self, time):
-        if time in self.__times:
-            index = self.__times.index(time)
-            return list(self.__locations[index])
-        elif time > self.__times[-1]:
-            return list(self.__locations[-1])
-        elif time < 0:
+        # Binary search of the waypoint (or segment) corresponding to 'time'
+        index = bisect_left(self.__timeList, time)
+        if index < len(self.__timeList) and self.__timeList[index] == time:
+            return self.__locations[index].tolist()
+        elif time > self.__timeList[-1]:
+            return self.__locations[-1].tolist()
+        elif time < 0 or index == 0:
             # Negative time not used
-            return list(self.__locations[0])
+            return self.__locations[0].tolist()
         else:
-            index = 0
-            for t in self.__times:
-                if t > time:
-                    break
-                index+= 1
-            interval = self.__times[index] - self.__times[index-1]
-            t3 = time - self.__times[index-1]
+            index = bisect_right(self.__timeList, time)
+            interval = self.__timeList[index] - self.__timeList[index-1]
+            t3 = time - self.__timeList[index-1]
             assert interval > 0
-            return self.calculate_location (self.__locations[index-1], self.__locations[index], interval, t3)
+            return self.calculate_location (self.__locations[index-1].tolist(), self.__locations[index].tolist(), interval, t3)
+    def get_locations(self, times):
+        # Vectorized version of get_location, returns an (M, D) array with the locations at each of the given times
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.__times) == 1:
+            return np.repeat(self.__locations, len(times), axis=0)
+        first = np.searchsorted(self.__times, times, side='left')
+        index = np.searchsorted(self.__times, times, side='right')
+        segment = np.clip(index, 1, len(self.__times) - 1)
+        p1 = self.__locations[segment-1]
+        p2 = self.__locations[segment]
+        interval = self.__times[segment] - self.__times[segment-1]
+        t3 = times - self.__times[segment-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            locations = p1 + (p2-p1)*(t3/interval)[:, None]
+        locations[index == 0] = self.__locations[0]
+        locations[index == len(self.__times)] = self.__locations[-1]
+        exact = first < index
+        locations[exact] = self.__locations[first[exact]]
+        return locations
     def calculate_location(self, p1, p2, interval, t3):
         location = []
         for i in range(len(p1)):
             location.append( p1[i] + (p2[i]-p1[i])*(t3/interval) )
         return location
     def get_wptimes(self):
-        return list (self.__times)
+        return list (self.__timeList)
+    def get_wptimes_array(self):
+        return self.__times
@@ -0,0 +1,180 @@
+import gzip, math, re
+import numpy as np
+from my_utils.bmReader import BmScenario
+from my_utils.bulkWriter import BulkWriter
+
+# NS2 mobility traces ('set X_' initial positions and '$ns_ at' setdest commands), also read by the
+# Ns2MobilityHelper of NS3. Scenarios are converted to NS2 node by node and NS2 traces are read back into
+# the columnar BmScenario representation.
+
+# Function to calculate distance between two coordinates
+def calculate_distance (origin, destination):
+    sum = 0
+    for i in range(len (origin)):
+        sum += (destination[i] - origin[i])**2
+    return math.sqrt(sum)
+
+# Generates the ns2 mobility of a single node, 'n' is the node number in the BonnMotion file and 'n_ns2' the
+# node index in the ns2 file. Returns the ns2 text and the warning messages produced during the conversion
+# Static segments are detected for the whole node at once with NumPy, speeds are still computed with
+# calculate_distance since x**2 (libm pow) may differ from a vectorized square in the last bit
+def convert_node (n, n_ns2, nodeTimes, nodeLocations, scn3D):
+    ns2Lines = []
+    messages = []
+    # create times and locations vectors for the current node
+    times = nodeTimes.tolist()
+    locations = nodeLocations.tolist()
+    static = np.all(nodeLocations[1:] == nodeLocations[:-1], axis=1).tolist()
+    setX = "$ns_ at {} \"$node_(%d) set X_ {}\"\n" % n_ns2
+    setY = "$ns_ at {} \"$node_(%d) set Y_ {}\"\n" % n_ns2
+    setZ = "$ns_ at {} \"$node_(%d) set Z_ {}\"\n" % n_ns2
+    if scn3D:
+        setdest = "$ns_ at {} \"$node_(%d) setdest {} {} {} {}\"\n" % n_ns2
+    else:
+        setdest = "$ns_ at {} \"$node_(%d) setdest {} {} {}\"\n" % n_ns2
+    # process and generate ns2 mobility for the current node
+    location = locations[0]
+    ns2Lines.append("$node_({}) set X_ {}\n".format(n_ns2, location[0]))
+    ns2Lines.append("$node_({}) set Y_ {}\n".format(n_ns2, location[1]))
+    if scn3D:
+        ns2Lines.append("$node_({}) set Z_ {}\n".format(n_ns2, location[2]))
+    for i in range (len (times) - 1):
+        time = times[i+1] - times[i]
+        origin = locations[i]
+        destination = locations[i+1]
+        if time == 0:
+            messages.append("warning at node {}: two waypoints with same time".format(n))
+            if destination[0] != origin[0]:
+                ns2Lines.append(setX.format(times[i], destination[0]))
+            if destination[1] != origin[1]:
+                ns2Lines.append(setY.format(times[i], destination[1]))
+            if scn3D and (destination[2] != origin[2]):
+                ns2Lines.append(setZ.format(times[i], destination[2]))
+            continue
+        elif time < 0:
+            messages.append("warning at node {}: trying to insert a waypoint with a past timestamp...".format(n))
+            messages.append("...the resulting ns2mobility could experience an unexpected pattern")
+            continue
+        speed = calculate_distance(origin, destination)/time
+        outputLine = setdest.format(times[i], *destination, speed)
+        if static[i]:
+            outputLine = "# " + outputLine
+        ns2Lines.append (outputLine)
+    return "".join(ns2Lines), messages
+
+# Converts a chunk of consecutive nodes, used by the worker processes. The chunk carries its own slice of the
+# waypoint columns with offsets relative to the slice, and the ns2 index of its first node
+def convert_chunk (chunk):
+    firstNs2, nodeIds, times, coords, offsets, scn3D = chunk
+    ns2Text = []
+    messages = []
+    for i in range(len(nodeIds)):
+        nodeText, nodeMessages = convert_node(nodeIds[i], firstNs2 + i, times[offsets[i]:offsets[i+1]], coords[offsets[i]:offsets[i+1]], scn3D)
+        ns2Text.append(nodeText)
+        messages.extend(nodeMessages)
+    return "".join(ns2Text), messages
+
+# Splits the scenario into chunks of 'chunkSize' nodes, in node order
+def scenario_chunks (bmScn, chunkSize):
+    for first in range(0, bmScn.node_count, chunkSize):
+        last = min(first + chunkSize, bmScn.node_count)
+        o0, o1 = bmScn.offsets[first], bmScn.offsets[last]
+        yield (first, bmScn.node_ids[first:last].tolist(), bmScn.times[o0:o1], bmScn.coords[o0:o1], bmScn.offsets[first:last+1] - o0, bmScn.is3D)
+
+
+# Writes a scenario as an NS2 mobility trace, returns the warning messages of the conversion
+def write_ns2_mobility(scenario, filename, compress=False):
+    messages = []
+    with BulkWriter(filename, compress) as ns2File:
+        for n_ns2, (n, nodeTimes, nodeLocations) in enumerate(scenario.iter_nodes()):
+            ns2Text, nodeMessages = convert_node(n, n_ns2, nodeTimes, nodeLocations, scenario.is3D)
+            ns2File.write(ns2Text)
+            messages.extend(nodeMessages)
+    return messages
+
+NS2_INITIAL = re.compile(r'\$node_\((\d+)\)\s+set\s+([XYZ])_\s+(\S+)')
+NS2_AT = re.compile(r'\$ns_\s+at\s+(\S+)\s+"\$node_\((\d+)\)\s+(?:set\s+([XYZ])_\s+(\S+)|setdest\s+([^"]+))"')
+
+# Reads an NS2 mobility trace into a BmScenario. Each node starts at its initial position at time 0, a
+# setdest command adds a waypoint where the node starts moving (when it was paused) and one at its
+# arrival time, a 'set X_' command issued during the simulation is a jump (two waypoints with the same
+# time). A setdest received before the previous destination is reached redirects the node from where it
+# is at that time. Commented setdest lines (static segments written by bmToNs2) are read as pauses.
+# All courses are extended to the end of the trace, where NS2 leaves the nodes at their last position.
+# The scenario is 3D when a setdest has a z coordinate or a node is placed at a z other than 0 (NS2
+# setdest traces set Z_ to 0 for 2D scenarios).
+def read_ns2_mobility(filename):
+    initial = {}
+    events = {}
+    is3D = False
+    with (gzip.open(filename, 'rt') if filename.endswith(".gz") else open(filename, 'r')) as ns2File:
+        for line in ns2File:
+            match = NS2_AT.search(line)
+            if match is not None:
+                t, node, axis, value, setdest = match.groups()
+                if setdest is not None:
+                    values = [float(v) for v in setdest.split()]
+                    if len(values) not in (3, 4):
+                        raise ValueError("invalid setdest command: {}".format(line.strip()))
+                    is3D = is3D or len(values) == 4
+                    events.setdefault(int(node), []).append((float(t), None, values))
+                else:
+                    is3D = is3D or (axis == 'Z' and float(value) != 0)
+                    events.setdefault(int(node), []).append((float(t), "XYZ".index(axis), float(value)))
+                continue
+            match = NS2_INITIAL.search(line)
+            if match is not None and not line.lstrip().startswith('#'):
+                node, axis, value = match.groups()
+                is3D = is3D or (axis == 'Z' and float(value) != 0)
+                initial.setdefault(int(node), [0.0, 0.0, 0.0])["XYZ".index(axis)] = float(value)
+    dims = 3 if is3D else 2
+    nodeIds = sorted(set(initial) | set(events))
+    if not nodeIds:
+        raise ValueError("{}: no NS2 mobility commands found".format(filename))
+    courses = []
+    for node in nodeIds:
+        nodeEvents = sorted(events.get(node, []), key=lambda event: event[0])
+        courses.append(node_waypoints(initial.get(node, [0.0, 0.0, 0.0])[:dims], nodeEvents, dims))
+    endTime = max((course[-1][0] for course in courses), default=0.0)
+    times, coords, counts = [], [], []
+    for course in courses:
+        if course[-1][0] < endTime:
+            course.append((endTime, course[-1][1]))
+        times.extend(t for t, location in course)
+        coords.extend(location for t, location in course)
+        counts.append(len(course))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.array(counts, dtype=np.int64), out=offsets[1:])
+    scenario = BmScenario(np.array(times, dtype=np.float64), np.array(coords, dtype=np.float64).reshape(-1, dims), offsets, is3D,
+                          np.array(nodeIds, dtype=np.int64))
+    scenario.file_node_count = nodeIds[-1] + 1 if nodeIds else 0
+    return scenario
+
+# Waypoints [(time, location)] of a node from its initial location and its time sorted events
+def node_waypoints(location, events, dims):
+    waypoints = [(0.0, list(location))]
+    jumpTime = None # time of the waypoint being built by 'set X_' commands
+    for t, axis, value in events:
+        lastTime, lastLocation = waypoints[-1]
+        if t < lastTime and len(waypoints) > 1:
+            # the node is redirected before reaching its destination
+            previousTime, previousLocation = waypoints[-2]
+            fraction = (t - previousTime) / (lastTime - previousTime)
+            waypoints[-1] = (t, [p + fraction * (l - p) for p, l in zip(previousLocation, lastLocation)])
+        elif t > lastTime:
+            waypoints.append((t, list(lastLocation)))
+        location = waypoints[-1][1]
+        if axis is None:
+            # a 2D setdest leaves the z coordinate of a 3D node unchanged
+            destination = (value[:-1] + location[len(value) - 1:])[:dims]
+            speed = value[-1]
+            jumpTime = None
+            if speed > 0 and destination != location:
+                waypoints.append((t + calculate_distance(location, destination) / speed, destination))
+        else:
+            if jumpTime != t:
+                waypoints.append((t, list(location)))
+                jumpTime = t
+            if axis < dims:
+                waypoints[-1][1][axis] = value
+    return waypoints
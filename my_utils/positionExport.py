@@ -0,0 +1,159 @@
+import json, os, shutil
+import numpy as np
+from my_utils.bulkWriter import BulkWriter, output_filename
+from my_utils.locationEngine import frame_times
+from my_utils.scnCache import load_scenario
+from my_utils.scnSlice import load_slice
+from my_utils.profiler import g_profiler
+
+# Export of the interpolated node positions at every frame of the timeline, without drawing them, so that
+# analysis jobs can memory-map the positions instead of interpolating the .movements text themselves.
+# Frames are computed by the interpolation engine in blocks of about 'blockElements' values, so memory
+# stays bounded whatever the length of the scenario, and written as they are computed:
+#   .npy        (frames, nodes, dims) array filled through a memory map, float32 by default. The frame
+#               times and node numbers are saved next to it in '<file>.index.npz'
+#   .positions  chunked columnar directory: one (frames, nodes) array per axis and chunk of 'chunkFrames'
+#               frames ('x_00000.npy', 'y_00000.npy', ...) plus times.npy, node_ids.npy and meta.json
+#   .csv        one line "time,node,x,y[,z]" per node and frame, full precision
+# load_positions opens the binary outputs without reading them.
+POSITIONS_VERSION = 1
+CHUNKED_SUFFIX = ".positions"
+INDEX_SUFFIX = ".index.npz"
+CHUNK_FRAMES = 256
+
+# Yields (first frame, (M, N, D) positions) blocks of the frame timeline
+def position_blocks(engine, frameTimes, blockElements=1 << 20):
+    blockFrames = max(1, blockElements // max(1, engine.node_count * engine.dims))
+    for f in range(0, len(frameTimes), blockFrames):
+        with g_profiler.stage("interpolate"):
+            yield f, engine.positions_block(frameTimes[f:f+blockFrames])
+
+# Writes the positions of every frame to 'outFile' (format given by its extension, see above), 'nodeIds'
+# gives the node numbers saved for the engine nodes. Returns the name of the written file.
+def export_positions(outFile, engine, frameTimes, nodeIds=None, compress=False, dtype=np.float32, chunkFrames=CHUNK_FRAMES, blockElements=1 << 20):
+    frameTimes = np.asarray(frameTimes, dtype=np.float64)
+    nodeIds = np.arange(engine.node_count, dtype=np.int64) if nodeIds is None else np.asarray(nodeIds, dtype=np.int64)
+    if outFile.endswith(".npy"):
+        positions = np.lib.format.open_memmap(outFile, mode='w+', dtype=dtype, shape=(len(frameTimes), engine.node_count, engine.dims))
+        for f, block in position_blocks(engine, frameTimes, blockElements):
+            positions[f:f+len(block)] = block
+        positions.flush()
+        del positions
+        np.savez(outFile + INDEX_SUFFIX, times=frameTimes, node_ids=nodeIds)
+        g_profiler.count("frames exported", len(frameTimes))
+        return outFile
+    if outFile.endswith(CHUNKED_SUFFIX):
+        write_chunked(outFile, engine, frameTimes, nodeIds, dtype, chunkFrames)
+        g_profiler.count("frames exported", len(frameTimes))
+        return outFile
+    outFile = output_filename(outFile, compress)
+    nodes = [",{},".format(n) for n in nodeIds.tolist()]
+    with BulkWriter(outFile, compress) as positionsFile:
+        positionsFile.write("time,node,x,y,z\n" if engine.dims == 3 else "time,node,x,y\n")
+        for f, block in position_blocks(engine, frameTimes, blockElements):
+            for frameTime, loctns in zip(frameTimes[f:f+len(block)].tolist(), block.tolist()):
+                prefix = str(frameTime)
+                positionsFile.write("".join(prefix + node + ",".join(map(str, loctn)) + "\n" for node, loctn in zip(nodes, loctns)))
+    g_profiler.count("frames exported", len(frameTimes))
+    return outFile
+
+# The chunks are computed one at a time, the directory is built aside and then renamed into place
+def write_chunked(outDir, engine, frameTimes, nodeIds, dtype, chunkFrames):
+    tmpDir = "{}.tmp{}".format(outDir, os.getpid())
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    os.mkdir(tmpDir)
+    try:
+        axes = "xyz"[:engine.dims]
+        chunkCount = 0
+        for c in range(0, len(frameTimes), chunkFrames):
+            chunkTimes = frameTimes[c:c+chunkFrames]
+            columns = [np.lib.format.open_memmap(os.path.join(tmpDir, "{}_{:05d}.npy".format(axis, chunkCount)), mode='w+', dtype=dtype,
+                                                 shape=(len(chunkTimes), engine.node_count)) for axis in axes]
+            for f, block in position_blocks(engine, chunkTimes):
+                for a, column in enumerate(columns):
+                    column[f:f+len(block)] = block[:, :, a]
+            for column in columns:
+                column.flush()
+            del columns
+            chunkCount += 1
+        np.save(os.path.join(tmpDir, "times.npy"), frameTimes)
+        np.save(os.path.join(tmpDir, "node_ids.npy"), nodeIds)
+        meta = {"version": POSITIONS_VERSION, "frame_count": len(frameTimes), "node_count": engine.node_count, "dims": engine.dims,
+                "dtype": np.dtype(dtype).name, "chunk_frames": chunkFrames, "chunk_count": chunkCount}
+        with open(os.path.join(tmpDir, "meta.json"), 'w') as metaFile:
+            json.dump(meta, metaFile)
+        shutil.rmtree(outDir, ignore_errors=True)
+        os.rename(tmpDir, outDir)
+    except:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+
+# Positions of a scenario sampled every 'interval' seconds over its time span (or the window [t0, t1]),
+# 'nodes' selects the nodes (file node numbers) as in scnSlice.load_slice. Returns the name of the written file
+def export_scenario_positions(movementsFile, outFile, interval=0.5, paramsFile=None, nodes=None, t0=None, t1=None, dims=None,
+                              dtype=np.float32, chunkFrames=CHUNK_FRAMES, useCache=True):
+    if nodes is not None or t0 is not None or t1 is not None:
+        scenario = load_slice(movementsFile, paramsFile, nodes, t0, t1, useCache)
+    else:
+        scenario = load_scenario(movementsFile, paramsFile, useCache)
+    stats = scenario.get_stats()
+    return export_positions(outFile, scenario.get_engine(dims), frame_times(stats.start_time, stats.end_time, interval), scenario.node_ids,
+                            dtype=dtype, chunkFrames=chunkFrames)
+
+# Exported positions opened for reading: 'times' (F,), 'node_ids' (N,) and frames(f0, f1) returning the
+# (f1 - f0, N, D) positions of a range of frames. The arrays are memory-mapped, only the frames asked for
+# are read from disk. For .npy files 'positions' is the whole memory-mapped (F, N, D) array.
+class PositionFile:
+    def __init__ (self, path):
+        self.path = path
+        self.chunked = os.path.isdir(path)
+        if self.chunked:
+            with open(os.path.join(path, "meta.json"), 'r') as metaFile:
+                self.meta = json.load(metaFile)
+            if self.meta.get("version") != POSITIONS_VERSION:
+                raise ValueError("{}: unsupported positions version {}".format(path, self.meta.get("version")))
+            self.times = np.load(os.path.join(path, "times.npy"), mmap_mode='r')
+            self.node_ids = np.load(os.path.join(path, "node_ids.npy"), mmap_mode='r')
+            self.dims = self.meta["dims"]
+            self.dtype = np.dtype(self.meta["dtype"])
+            self.positions = None
+        else:
+            self.positions = np.load(path, mmap_mode='r')
+            self.dims = self.positions.shape[2]
+            self.dtype = self.positions.dtype
+            try:
+                with np.load(path + INDEX_SUFFIX) as index:
+                    self.times = index["times"]
+                    self.node_ids = index["node_ids"]
+            except OSError:
+                self.times = None
+                self.node_ids = np.arange(self.positions.shape[1], dtype=np.int64)
+        self.frame_count = len(self.times) if self.times is not None else self.positions.shape[0]
+        self.node_count = len(self.node_ids)
+
+    def __chunk(self, c):
+        return [np.load(os.path.join(self.path, "{}_{:05d}.npy".format(axis, c)), mmap_mode='r') for axis in "xyz"[:self.dims]]
+
+    def frames(self, f0, f1):
+        f0, f1 = max(0, f0), min(f1, self.frame_count)
+        if not self.chunked:
+            return np.asarray(self.positions[f0:f1])
+        block = np.empty((max(0, f1 - f0), self.node_count, self.dims), dtype=self.dtype)
+        chunkFrames = self.meta["chunk_frames"]
+        for c in range(f0 // chunkFrames, (f1 - 1) // chunkFrames + 1 if f1 > f0 else 0):
+            first = c * chunkFrames
+            lo, hi = max(f0, first), min(f1, first + chunkFrames)
+            for a, column in enumerate(self.__chunk(c)):
+                block[lo - f0:hi - f0, :, a] = column[lo - first:hi - first]
+        return block
+
+    # Course of a single node (index in node_ids) over all the frames as an (F, D) array
+    def node_positions(self, i):
+        if not self.chunked:
+            return np.asarray(self.positions[:, i])
+        if self.frame_count == 0:
+            return np.zeros((0, self.dims), dtype=self.dtype)
+        return np.concatenate([np.column_stack([column[:, i] for column in self.__chunk(c)]) for c in range(self.meta["chunk_count"])])
+
+def load_positions(path):
+    return PositionFile(path)
@@ -0,0 +1,125 @@
+import atexit, cProfile, math, time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+# Instrumentation shared by the tools: stage timers, counters and a histogram of the frame times of the
+# animation loop, printed as a summary table at exit (--profile), plus an optional cProfile dump
+# (--cprofile out.prof). While disabled, stage() returns a shared null context and count() returns at
+# once, so instrumented code costs nothing; per frame measurements are guarded with 'enabled'.
+# Work done in worker processes (-j) is only seen as the time of the stage that waits for it.
+class Profiler:
+    def __init__ (self):
+        self.enabled = False
+        self.stages = OrderedDict() # name: [seconds, calls]
+        self.counters = OrderedDict()
+        self.frameTimes = None
+        self.__cprofile = None
+        self.__cprofileFile = None
+        self.__nullStage = nullcontext()
+        self.__started = None
+
+    # Turns the instrumentation on, 'histogram' keeps the time of every animation frame
+    def enable(self, cprofileFile=None, histogram=False, summary=True):
+        if self.__started is None:
+            self.__started = time.perf_counter()
+            atexit.register(self.finish)
+        self.enabled = self.enabled or summary
+        if histogram:
+            self.enabled = True
+            self.frameTimes = []
+        if cprofileFile is not None and self.__cprofile is None:
+            self.__cprofileFile = cprofileFile
+            self.__cprofile = cProfile.Profile()
+            self.__cprofile.enable()
+
+    def stage(self, name):
+        if not self.enabled:
+            return self.__nullStage
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_frame_time(self, seconds):
+        self.add_time("draw frame", seconds)
+        if self.frameTimes is not None:
+            self.frameTimes.append(seconds)
+
+    def report(self):
+        lines = ["", "Profile summary (wall time {:.3f}s):".format(time.perf_counter() - self.__started)]
+        if self.stages:
+            lines.append("\t{:<24}{:>12}{:>10}{:>14}".format("stage", "seconds", "calls", "ms/call"))
+            for name, (seconds, calls) in self.stages.items():
+                lines.append("\t{:<24}{:>12.4f}{:>10}{:>14.3f}".format(name, seconds, calls, 1000 * seconds / calls))
+        if self.counters:
+            lines.append("\t{:<24}{:>12}".format("counter", "value"))
+            for name, value in self.counters.items():
+                lines.append("\t{:<24}{:>12}".format(name, value))
+        if self.frameTimes:
+            lines.append(format_histogram(self.frameTimes))
+        return "\n".join(lines)
+
+    # Stops cProfile and prints the summary, called at exit
+    def finish(self):
+        if self.__cprofile is not None:
+            self.__cprofile.disable()
+            self.__cprofile.dump_stats(self.__cprofileFile)
+            print("\ncProfile statistics written to {}".format(self.__cprofileFile))
+            self.__cprofile = None
+        if self.enabled:
+            print(self.report())
+            self.enabled = False
+
+class _Stage:
+    def __init__ (self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, excType, excValue, traceback):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+# Text histogram of frame times in power of two millisecond bins
+def format_histogram(frameTimes, width=40):
+    frameMs = sorted(1000 * t for t in frameTimes)
+    count = len(frameMs)
+    lines = ["\tframe times: {} frames, mean {:.2f}ms, median {:.2f}ms, p95 {:.2f}ms, max {:.2f}ms".format(
+             count, sum(frameMs) / count, frameMs[count // 2], frameMs[min(count - 1, int(count * 0.95))], frameMs[-1])]
+    bins = OrderedDict()
+    for ms in frameMs:
+        upper = 2 ** max(0, math.ceil(math.log2(ms))) if ms > 0 else 1
+        bins[upper] = bins.get(upper, 0) + 1
+    largest = max(bins.values())
+    for upper, n in bins.items():
+        label = "<= {:g}ms".format(upper)
+        lines.append("\t{:>12} {:>7} {}".format(label, n, "#" * max(1, round(width * n / largest))))
+    return "\n".join(lines)
+
+# Profiler shared by all the modules of a run
+g_profiler = Profiler()
+
+# Handles the --profile, --cprofile <file> and --histogram options, returns True if 'arg' was one of them
+def profile_option(arg, argIter):
+    if arg == '--profile':
+        g_profiler.enable()
+    elif arg == '--cprofile':
+        cprofileFile = next(argIter, None)
+        if cprofileFile is None:
+            raise ValueError("a filename is expected after '--cprofile' option")
+        g_profiler.enable(cprofileFile=cprofileFile, summary=False)
+    elif arg == '--histogram':
+        g_profiler.enable(histogram=True)
+    else:
+        return False
+    return True
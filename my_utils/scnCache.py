@@ -0,0 +1,120 @@
+import json, os, shutil, sys
+import numpy as np
+from my_utils.bmReader import BmScenario, read_movements, read_params
+from my_utils.scnStats import STATS_ARRAYS, ScenarioStats
+from my_utils.profiler import g_profiler
+
+# Binary cache of parsed scenarios. The first time a .movements file is loaded its columnar arrays are
+# saved as .npy files in a '<scenario>.movements.cache' directory next to it, together with a meta.json
+# file holding the parsed .params and the size and modification time of the source files. Later loads
+# memory-map the arrays as long as the source files have not changed. The statistics index of the scenario
+# is stored along with the waypoints ('stats_*.npy').
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".cache"
+CACHE_ARRAYS = ("times", "coords", "offsets", "node_ids")
+
+def get_cache_dir(movementsFile):
+    return movementsFile + CACHE_SUFFIX
+
+# Size and modification time identifying the current version of a file, None if it does not exist
+def file_signature(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def read_cache_meta(cacheDir):
+    try:
+        with open(os.path.join(cacheDir, "meta.json"), 'r') as metaFile:
+            meta = json.load(metaFile)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def write_cache_meta(cacheDir, meta):
+    tmpName = os.path.join(cacheDir, "meta.json.tmp")
+    with open(tmpName, 'w') as metaFile:
+        json.dump(meta, metaFile)
+    os.replace(tmpName, os.path.join(cacheDir, "meta.json"))
+
+# Writes the scenario arrays and meta data, the directory is built aside and then renamed into place
+def write_cache(cacheDir, scenario, meta):
+    with g_profiler.stage("write cache"):
+        _write_cache(cacheDir, scenario, meta)
+
+def _write_cache(cacheDir, scenario, meta):
+    tmpDir = "{}.tmp{}".format(cacheDir, os.getpid())
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    os.mkdir(tmpDir)
+    try:
+        for name in CACHE_ARRAYS:
+            np.save(os.path.join(tmpDir, name + ".npy"), getattr(scenario, name))
+        stats = scenario.get_stats()
+        for name in STATS_ARRAYS:
+            np.save(os.path.join(tmpDir, "stats_" + name + ".npy"), getattr(stats, name))
+        write_cache_meta(tmpDir, meta)
+        shutil.rmtree(cacheDir, ignore_errors=True)
+        os.rename(tmpDir, cacheDir)
+    except:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+
+def load_cache(cacheDir, meta):
+    with g_profiler.stage("load cache"):
+        return _load_cache(cacheDir, meta)
+
+def _load_cache(cacheDir, meta):
+    arrays = {}
+    for name in CACHE_ARRAYS:
+        arrays[name] = np.load(os.path.join(cacheDir, name + ".npy"), mmap_mode='r')
+    scenario = BmScenario(arrays["times"], arrays["coords"], arrays["offsets"], meta["is3D"], arrays["node_ids"], meta["params"])
+    scenario.file_node_count = meta["file_node_count"]
+    scenario.stats = ScenarioStats(*[np.load(os.path.join(cacheDir, "stats_" + name + ".npy")) for name in STATS_ARRAYS])
+    return scenario
+
+# Scenario loaded from the binary cache if it is up to date with the .movements file, None otherwise
+# The .params values are refreshed when only the .params file changed
+def load_cached_scenario(movementsFile, paramsFile=None):
+    cacheDir = get_cache_dir(movementsFile)
+    movementsSignature = file_signature(movementsFile)
+    paramsSignature = file_signature(paramsFile) if paramsFile is not None else None
+    meta = read_cache_meta(cacheDir)
+    if meta is None or movementsSignature is None or meta["movements"] != movementsSignature:
+        return None
+    if paramsFile is not None and meta["params_file"] != paramsSignature:
+        # Only the .params file changed, the waypoint arrays are still valid
+        meta["params"] = read_params(paramsFile) if paramsSignature is not None else {}
+        meta["params_file"] = paramsSignature
+        try:
+            write_cache_meta(cacheDir, meta)
+        except OSError:
+            pass
+    try:
+        return load_cache(cacheDir, meta)
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Loads a scenario from its .movements file (and optionally its .params file) using the binary cache
+# when it is up to date, otherwise the text files are parsed and the cache is (re)written.
+def load_scenario(movementsFile, paramsFile=None, useCache=True):
+    if not useCache:
+        scenario = read_movements(movementsFile)
+        if paramsFile is not None and os.path.exists(paramsFile):
+            scenario.params = read_params(paramsFile)
+        return scenario
+    scenario = load_cached_scenario(movementsFile, paramsFile)
+    if scenario is not None:
+        return scenario
+    movementsSignature = file_signature(movementsFile)
+    paramsSignature = file_signature(paramsFile) if paramsFile is not None else None
+    scenario = read_movements(movementsFile)
+    if paramsSignature is not None:
+        scenario.params = read_params(paramsFile)
+    meta = {"version": CACHE_VERSION, "movements": movementsSignature, "params_file": paramsSignature, "params": scenario.params,
+            "is3D": scenario.is3D, "file_node_count": scenario.file_node_count}
+    try:
+        write_cache(get_cache_dir(movementsFile), scenario, meta)
+    except OSError:
+        print("warning: could not write scenario cache {}: {}".format(get_cache_dir(movementsFile), sys.exc_info()[1]))
+    return scenario
@@ -0,0 +1,167 @@
+import numpy as np
+from matplotlib.figure import figaspect
+from matplotlib.collections import LineCollection
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from my_utils.spatialGrid import neighbor_pairs
+from my_utils.netSimUtils import getPlotMargins, calculateFigDimensions, calculateZlim
+
+# Size of the figure used to display a scenario given its .params
+def figure_size(figParams, scn3D):
+    if scn3D:
+        return (10, 4.8)
+    xyRelation, sizeMultiplier = calculateFigDimensions(*plot_spans(figParams)[:2])
+    return figaspect(xyRelation)*sizeMultiplier
+
+# Lower bounds and sizes of the x, y and z axes, the lower bounds are 0 unless given by plot_extents
+def plot_lower_bounds(figParams):
+    return [figParams.get(key + 'min', 0.0) for key in ('x', 'y', 'z')]
+
+def plot_spans(figParams):
+    return [figParams.get(key, figParams['x']) - lower for key, lower in zip(('x', 'y', 'z'), plot_lower_bounds(figParams))]
+
+# Axes and artists of a scenario visualization. The figure is created by the caller (pyplot for the
+# interactive window, a plain Figure with an Agg canvas for headless rendering). The scatter, label and
+# time artists are created once and only updated by draw_frame
+# Level of detail: when a frame has more than 'lodThreshold' nodes they are shown either as a density
+# raster ('density', 2D only) or decimated to one point per grid cell ('decimate'). The grid spans the x, y
+# (and z) values of the .params file with about rasterSize**2 cells of (nearly) equal sides
+# Links: when 'linkRange' is given, the node pairs within that range (found with a spatial grid) are joined
+# by the segments of a line collection
+class ScenarioFigure:
+    def __init__ (self, fig, scnName, figParams, scn3D, nodeCount, drawLabel=False, animated=False, lodThreshold=None, lodMode='density', rasterSize=200,
+                  linkRange=None, nodeIds=None):
+        self.fig = fig
+        self.scn3D = scn3D
+        self.drawLabel = drawLabel
+        self.linkRange = linkRange
+        self.lodThreshold = lodThreshold
+        self.lodMode = 'decimate' if scn3D else lodMode
+        # PREPARING THE FIGURE
+        if scn3D:
+            fig.subplots_adjust(left= -0.05, bottom = 0.02, right= 1, top = 0.92)
+        else:
+            xyRelation, sizeMultiplier = calculateFigDimensions(*plot_spans(figParams)[:2])
+            fig.subplots_adjust(**getPlotMargins(xyRelation))
+        if fig.canvas.manager is not None:
+            fig.canvas.manager.set_window_title("Drone Mobility Scenario Visualization")
+        ax = fig.add_subplot(111, projection= '3d' if scn3D else None)
+        self.ax = ax
+        if scn3D:
+            ax.view_init (elev= 25, azim= -75)
+        xMin, yMin, zMin = plot_lower_bounds(figParams)
+        ax.set_xlim(xMin, figParams['x'])
+        ax.set_ylim(yMin, figParams['y'])
+        ax.set_xlabel('x-axis')
+        ax.set_ylabel('y-axis')
+        if scn3D:
+            zlim = calculateZlim(figParams['x'], figParams['y'], figParams['z'])
+            ax.set_zlim(zMin, zlim)
+            ax.set_zlabel('z-axis')
+        else:
+            ax.grid()
+            ax.set_axisbelow(True)
+            ax.minorticks_on()
+            ax.grid(which='major', linewidth=0.4)
+        if 'model' in figParams:
+            ax.title.set_text(f"{scnName} ({figParams['model']})")
+        else:
+            ax.title.set_text(f"{scnName}")
+        # Artists updated on each frame, created with all nodes at the origin
+        nodeOrigin = [0] * nodeCount
+        if scn3D:
+            self.nodeSet = ax.scatter(nodeOrigin, nodeOrigin, nodeOrigin, s= 10, c = 'b', animated=animated)
+            self.timeText = ax.text2D(0.01, 0.97, "", transform=ax.transAxes, animated=animated)
+        else:
+            self.nodeSet = ax.scatter(nodeOrigin, nodeOrigin, s= 10, c = 'b', animated=animated)
+            self.timeText = ax.text(0.01, 0.97, "", transform=ax.transAxes, va='top', bbox=dict(facecolor='w', edgecolor='none', alpha=0.7), animated=animated)
+        self.animated = animated
+        self.labelList = []
+        self.set_node_count(nodeCount, nodeIds)
+        self.linkSet = None
+        if linkRange is not None:
+            if scn3D:
+                self.linkSet = Line3DCollection(np.zeros((0, 2, 3)), colors='g', linewidths=0.5, alpha=0.6, animated=animated)
+            else:
+                self.linkSet = LineCollection(np.zeros((0, 2, 2)), colors='g', linewidths=0.5, alpha=0.6, zorder=1, animated=animated)
+            ax.add_collection(self.linkSet, autolim=False)
+        self.densityImage = None
+        if lodThreshold is not None:
+            dims = 3 if scn3D else 2
+            self.lodOrigin = np.array(plot_lower_bounds(figParams)[:dims], dtype=np.float64)
+            self.lodExtents = np.array(plot_spans(figParams)[:dims], dtype=np.float64)
+            # Number of cells along each axis, proportional to the extents
+            ratios = self.lodExtents / self.lodExtents[0]
+            cellsPerUnit = (rasterSize**2 / np.prod(ratios)) ** (1 / len(ratios))
+            self.lodBins = np.maximum(1, np.round(cellsPerUnit * ratios)).astype(np.int64)
+            if self.lodMode == 'density':
+                self.densityImage = ax.imshow(np.zeros(self.lodBins[::-1]), extent=(xMin, figParams['x'], yMin, figParams['y']), origin='lower', cmap='Blues',
+                                              interpolation='nearest', aspect='auto', zorder=0, visible=False, animated=animated)
+
+    # Creates the labels of the nodes added to the scenario (when it is read progressively), labels show the
+    # node numbers in the file given by 'nodeIds' (the node indexes by default)
+    def set_node_count(self, nodeCount, nodeIds=None):
+        if not self.drawLabel:
+            return
+        for i in range(len(self.labelList), nodeCount):
+            label = str(i) if nodeIds is None else str(nodeIds[i])
+            if self.scn3D:
+                self.labelList.append(self.ax.text(0, 0, 0, '%s' % (label), zdir='x', size=8, color='k', animated=self.animated))
+            else:
+                self.labelList.append(self.ax.text(0, 0, '%s' % (label), size=8, color='k', animated=self.animated))
+
+    def get_artists(self):
+        artists = [self.nodeSet, self.timeText] + self.labelList
+        if self.linkSet is not None:
+            artists.insert(0, self.linkSet)
+        if self.densityImage is not None:
+            artists.insert(0, self.densityImage)
+        return artists
+
+    # Grid cell of each node, -1 for nodes outside the extents
+    def __cells(self, loctns):
+        offsets = loctns - self.lodOrigin
+        bins = (offsets * (self.lodBins / self.lodExtents)).astype(np.int64)
+        inside = np.all((bins >= 0) & (bins < self.lodBins), axis=1) & np.all(offsets >= 0, axis=1)
+        cells = np.ravel_multi_index(tuple(np.where(inside, bins.T, 0)), tuple(self.lodBins))
+        return np.where(inside, cells, -1)
+
+    def __draw_lod(self, loctns):
+        cells = self.__cells(loctns)
+        if self.lodMode == 'density':
+            counts = np.bincount(cells[cells >= 0], minlength=int(np.prod(self.lodBins)))
+            # cells are indexed as (x, y), the image as (row=y, column=x)
+            density = counts.reshape(self.lodBins).T
+            # empty cells are masked so that the grid remains visible
+            self.densityImage.set_data(np.ma.masked_equal(density, 0))
+            self.densityImage.set_clim(0, max(1, density.max()))
+            return np.empty((0, loctns.shape[1]))
+        # decimation, the first node found in each occupied cell is drawn
+        occupied, first = np.unique(cells, return_index=True)
+        return loctns[first[occupied >= 0]]
+
+    # Updates the artists with the (N, 2) or (N, 3) node locations of a frame and returns them
+    def draw_frame(self, loctns, frameTime):
+        self.timeText.set_text("time:{:7.2f}s".format(frameTime))
+        if self.linkSet is not None:
+            # links are found among all the nodes, also when they are drawn with a level of detail
+            self.linkSet.set_segments(loctns[neighbor_pairs(loctns, self.linkRange)])
+        lod = self.lodThreshold is not None and len(loctns) > self.lodThreshold
+        if self.lodThreshold is not None:
+            if self.densityImage is not None:
+                self.densityImage.set_visible(lod)
+            for label in self.labelList:
+                label.set_visible(not lod)
+            if lod:
+                loctns = self.__draw_lod(loctns)
+        if self.scn3D:
+            self.nodeSet._offsets3d = (loctns[:, 0], loctns[:, 1], loctns[:, 2])
+            if self.drawLabel and not lod:
+                for label, (x, y, z) in zip(self.labelList, loctns.tolist()):
+                    label.set_position((x+5, y+5))
+                    label.set_3d_properties(z=z, zdir='x')
+        else:
+            self.nodeSet.set_offsets(loctns)
+            if self.drawLabel and not lod:
+                for label, (x, y) in zip(self.labelList, loctns.tolist()):
+                    label.set_position((x+5, y+5))
+        return self.get_artists()
@@ -0,0 +1,161 @@
+import gzip, json, os
+import numpy as np
+from my_utils.bmReader import BmScenario
+from my_utils.bulkWriter import BulkWriter, format_movements_lines, output_filename
+from my_utils.scnCache import load_scenario
+from my_utils.scnSlice import load_slice, select_nodes, trim_scenario
+from my_utils.ns2Mobility import read_ns2_mobility, write_ns2_mobility
+from my_utils.profiler import g_profiler
+
+# Scenario file formats of the converter. Every format has a reader returning a BmScenario (the shared
+# columnar representation) and a writer taking one, so any format can be converted to any other:
+#   bonnmotion  .movements (+ .params) text files, read through the binary cache
+#   ns2         NS2 mobility trace (setdest commands), also accepted by the NS3 Ns2MobilityHelper
+#   csv         one waypoint per line "node,time,x,y[,z]", as given to the NS3 WaypointMobilityModel
+#   binary      .npz archive of the columnar arrays, the fastest to load
+# Readers take (filename, useCache), writers (scenario, filename, compress) and return warning messages.
+# Compressed text output is a gzip stream, the name given to the writers should end in '.gz' (see
+# converted_filename), binary archives are zip-compressed instead.
+class ScenarioFormat:
+    def __init__ (self, name, extensions, reader, writer):
+        self.name = name
+        self.extensions = extensions # the first one is used for output files
+        self.read = reader
+        self.write = writer
+
+WRITE_BATCH_NODES = 1024
+
+def read_bonnmotion(filename, useCache=True):
+    paramsFile = bonnmotion_basename(filename) + ".params"
+    return load_scenario(filename, paramsFile if os.path.exists(paramsFile) else None, useCache)
+
+def bonnmotion_basename(filename):
+    filename = filename[:-3] if filename.endswith(".gz") else filename
+    return filename[:-len(".movements")] if filename.endswith(".movements") else filename
+
+# Writes the .movements file and a .params file next to it, the .params values of the source scenario are
+# kept, when there are none the area, duration and number of nodes are taken from the waypoints
+def write_bonnmotion(scenario, filename, compress=False):
+    with BulkWriter(filename, compress) as movementsFile:
+        if scenario.is3D:
+            movementsFile.write("#3D\n")
+        for b in range(0, scenario.node_count, WRITE_BATCH_NODES):
+            batch = np.asarray(scenario.offsets[b:b+WRITE_BATCH_NODES+1])
+            movementsFile.write(format_movements_lines(scenario.times[batch[0]:batch[-1]], scenario.coords[batch[0]:batch[-1]], batch - batch[0]))
+    params = scenario.params
+    if not params:
+        stats = scenario.get_stats()
+        params = {axis: float(stats.max[a]) for a, axis in enumerate(("x", "y", "z")[:scenario.dims])}
+        params.update({"duration": stats.end_time, "nn": scenario.node_count, "J": "3D" if scenario.is3D else "2D"})
+    with open(bonnmotion_basename(filename) + ".params", 'w') as paramsFile:
+        paramsFile.write("".join("{}={}\n".format(key, value) for key, value in params.items()))
+    return []
+
+def read_ns2(filename, useCache=True):
+    return read_ns2_mobility(filename)
+
+def write_ns2(scenario, filename, compress=False):
+    return write_ns2_mobility(scenario, filename, compress)
+
+# Waypoints of the CSV file are grouped by node keeping their order in the file
+def read_csv(filename, useCache=True):
+    with (gzip.open(filename, 'rt') if filename.endswith(".gz") else open(filename, 'r')) as csvFile:
+        header = csvFile.readline()
+        skip = 1 if header[:1].isalpha() else 0
+    rows = np.loadtxt(filename, delimiter=',', comments='#', skiprows=skip, ndmin=2)
+    if rows.shape[1] not in (4, 5):
+        raise ValueError("{}: 4 or 5 columns (node,time,x,y[,z]) expected, found {}".format(filename, rows.shape[1]))
+    nodes = rows[:, 0].astype(np.int64)
+    order = np.argsort(nodes, kind='stable')
+    nodeIds, counts = np.unique(nodes, return_counts=True)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    scenario = BmScenario(np.ascontiguousarray(rows[order, 1]), np.ascontiguousarray(rows[order, 2:]), offsets, rows.shape[1] == 5, nodeIds)
+    scenario.file_node_count = int(nodeIds[-1]) + 1 if len(nodeIds) else 0
+    return scenario
+
+def write_csv(scenario, filename, compress=False):
+    with BulkWriter(filename, compress) as csvFile:
+        csvFile.write("node,time,x,y,z\n" if scenario.is3D else "node,time,x,y\n")
+        for b in range(0, scenario.node_count, WRITE_BATCH_NODES):
+            batch = np.asarray(scenario.offsets[b:b+WRITE_BATCH_NODES+1])
+            nodes = np.repeat(np.asarray(scenario.node_ids[b:b+WRITE_BATCH_NODES]), np.diff(batch)).tolist()
+            values = np.column_stack((scenario.times[batch[0]:batch[-1]], scenario.coords[batch[0]:batch[-1]])).tolist()
+            csvFile.write("".join("{},{}\n".format(n, ",".join(map(str, row))) for n, row in zip(nodes, values)))
+    return []
+
+def read_binary(filename, useCache=True):
+    with np.load(filename) as archive:
+        scenario = BmScenario(archive["times"], archive["coords"], archive["offsets"], bool(archive["is3D"]), archive["node_ids"],
+                              json.loads(str(archive["params"])))
+        scenario.file_node_count = int(archive["file_node_count"])
+    return scenario
+
+# The archive is written through a file object so that NumPy does not append '.npz' to other names
+def write_binary(scenario, filename, compress=False):
+    save = np.savez_compressed if compress else np.savez
+    with open(filename, 'wb') as archiveFile:
+        save(archiveFile, times=np.asarray(scenario.times), coords=np.asarray(scenario.coords), offsets=np.asarray(scenario.offsets),
+             node_ids=np.asarray(scenario.node_ids), is3D=scenario.is3D, file_node_count=scenario.file_node_count,
+             params=json.dumps(scenario.params))
+    return []
+
+FORMATS = {f.name: f for f in (ScenarioFormat("bonnmotion", (".movements",), read_bonnmotion, write_bonnmotion),
+                               ScenarioFormat("ns2", (".ns_movements", ".tcl"), read_ns2, write_ns2),
+                               ScenarioFormat("csv", (".csv",), read_csv, write_csv),
+                               ScenarioFormat("binary", (".npz",), read_binary, write_binary))}
+
+def get_format(name):
+    if name not in FORMATS:
+        raise ValueError("unknown format '{}', expected one of: {}".format(name, ", ".join(FORMATS)))
+    return FORMATS[name]
+
+# Format of a file from its extension ('.gz' compressed files are recognized too), None if unknown
+def detect_format(filename):
+    filename = filename[:-3] if filename.endswith(".gz") else filename
+    for scnFormat in FORMATS.values():
+        if any(filename.endswith(extension) for extension in scnFormat.extensions):
+            return scnFormat
+    return None
+
+# Name of the file 'filename' converted to 'scnFormat', in 'outDir' when given
+def converted_filename(filename, scnFormat, outDir=None, compress=False):
+    source = detect_format(filename)
+    base = filename[:-3] if filename.endswith(".gz") else filename
+    if source is not None:
+        for extension in source.extensions:
+            if base.endswith(extension):
+                base = base[:-len(extension)]
+                break
+    if outDir is not None:
+        base = os.path.join(outDir, os.path.basename(base))
+    return compressed_filename(base + scnFormat.extensions[0], scnFormat, compress)
+
+def compressed_filename(filename, scnFormat, compress):
+    return filename if scnFormat.name == "binary" else output_filename(filename, compress)
+
+# Reads a scenario in any format, the node selection and time window (see scnSlice.load_slice) are read
+# directly from BonnMotion files and applied after reading for the other formats
+def read_scenario(filename, scnFormat=None, useCache=True, nodes=None, t0=None, t1=None):
+    scnFormat = scnFormat or detect_format(filename)
+    if scnFormat is None:
+        raise ValueError("{}: unknown scenario format".format(filename))
+    with g_profiler.stage("read scenario"):
+        if scnFormat.name == "bonnmotion" and (nodes is not None or t0 is not None or t1 is not None):
+            paramsFile = bonnmotion_basename(filename) + ".params"
+            return load_slice(filename, paramsFile if os.path.exists(paramsFile) else None, nodes, t0, t1, useCache)
+        scenario = scnFormat.read(filename, useCache)
+        if nodes is not None:
+            scenario = select_nodes(scenario, np.flatnonzero(np.isin(scenario.node_ids, nodes)))
+        return trim_scenario(scenario, t0, t1)
+
+# Converts a scenario file, returns the scenario that was read and the warning messages of the writer
+def convert_file(inFile, outFile, inFormat=None, outFormat=None, compress=False, useCache=True, selection=None):
+    scenario = read_scenario(inFile, inFormat, useCache, **(selection or {}))
+    outFormat = outFormat or detect_format(outFile)
+    if outFormat is None:
+        raise ValueError("{}: unknown scenario format".format(outFile))
+    with g_profiler.stage("write scenario"):
+        messages = outFormat.write(scenario, outFile, compress)
+    g_profiler.count("scenarios converted")
+    return scenario, messages
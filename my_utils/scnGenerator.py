@@ -0,0 +1,32 @@
+import numpy as np
+from my_utils.bulkWriter import BulkWriter, format_movements_lines
+
+# Synthetic BonnMotion scenarios for benchmarking: every node moves through 'waypoints' random points of
+# the x*y(*z) area at random times between 0 and 'duration' (the first waypoint at 0, the last at duration).
+# The .movements and .params files are written as BonnMotion does.
+def generate_scenario(nodeCount, waypoints, duration, is3D=False, area=(1000.0, 1000.0, 300.0), seed=0):
+    rng = np.random.default_rng(seed)
+    dims = 3 if is3D else 2
+    waypoints = max(2, waypoints)
+    times = np.sort(rng.uniform(0, duration, (nodeCount, waypoints)), axis=1)
+    times[:, 0] = 0.0
+    times[:, -1] = duration
+    coords = rng.uniform(0, 1, (nodeCount, waypoints, dims)) * np.array(area[:dims])
+    offsets = np.arange(nodeCount + 1, dtype=np.int64) * waypoints
+    return times.reshape(-1), coords.reshape(-1, dims), offsets
+
+def write_scenario(scnName, times, coords, offsets, duration, area=(1000.0, 1000.0, 300.0), seed=0, batchNodes=1024):
+    is3D = coords.shape[1] == 3
+    nodeCount = len(offsets) - 1
+    with BulkWriter(scnName + ".movements") as movementsFile:
+        if is3D:
+            movementsFile.write("#3D\n")
+        for b in range(0, nodeCount, batchNodes):
+            batch = offsets[b:b+batchNodes+1]
+            movementsFile.write(format_movements_lines(times[batch[0]:batch[-1]], coords[batch[0]:batch[-1]], batch - batch[0]))
+    params = ["model=Synthetic", "randomSeed={}".format(seed), "x={}".format(float(area[0])), "y={}".format(float(area[1]))]
+    if is3D:
+        params.append("z={}".format(float(area[2])))
+    params += ["duration={}".format(float(duration)), "nn={}".format(nodeCount), "J={}".format("3D" if is3D else "2D")]
+    with open(scnName + ".params", 'w') as paramsFile:
+        paramsFile.write("\n".join(params) + "\n")
@@ -0,0 +1,78 @@
+import numpy as np
+from my_utils.nodeCourse import NodeCourse
+
+# Array engine merging all the nodes of a child scenario with the course of a parent node. For every child
+# node the joint timeline is the union of its waypoint times and the parent's, child and parent locations
+# are interpolated at all those times at once (with the same rules as NodeCourse.get_location) and combined
+# as: child + parent + offset, or for Z when scaling: child*s_a + parent + s_b + offset.
+# Returns the packed (times, coords, offsets) of the joint scenario.
+def merge_scenario(child, parent, offset, scn3D, zScaling=None):
+    # Child waypoints stably sorted by (node, time) as NodeCourse does
+    counts = np.diff(child.offsets)
+    nodeIds = np.repeat(np.arange(child.node_count, dtype=np.int64), counts)
+    order = np.lexsort((child.times, nodeIds))
+    childTimes = np.asarray(child.times)[order]
+    childCoords = np.asarray(child.coords)[order]
+    # Joint timeline, rows of (node, time) without duplicates
+    parentTimes = parent.get_wptimes_array()
+    rowNodes = np.concatenate((nodeIds, np.repeat(np.arange(child.node_count, dtype=np.int64), len(parentTimes))))
+    rowTimes = np.concatenate((childTimes, np.tile(parentTimes, child.node_count)))
+    order = np.lexsort((rowTimes, rowNodes))
+    rowNodes = rowNodes[order]
+    rowTimes = rowTimes[order]
+    keep = np.ones(len(rowTimes), dtype=bool)
+    keep[1:] = (rowNodes[1:] != rowNodes[:-1]) | (rowTimes[1:] != rowTimes[:-1])
+    rowNodes = rowNodes[keep]
+    rowTimes = rowTimes[keep]
+    mxOffsets = np.zeros(child.node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rowNodes, minlength=child.node_count), out=mxOffsets[1:])
+
+    childLocations = interpolate_courses(childTimes, childCoords, child.offsets, rowNodes, rowTimes)
+    parentLocations = parent.get_locations(rowTimes)
+    # This is a compensation when 2D and 3D scenarios are added
+    if childLocations.shape[1] == 2 and scn3D:
+        childLocations = np.column_stack((childLocations, np.zeros(len(rowTimes))))
+    if parentLocations.shape[1] == 2 and scn3D:
+        parentLocations = np.column_stack((parentLocations, np.zeros(len(rowTimes))))
+    dims = childLocations.shape[1] # X, Y and (if applicable) Z
+    mxCoords = childLocations + parentLocations[:, :dims] + np.asarray(offset[:dims], dtype=np.float64)
+    if zScaling is not None:
+        s_a, s_b = zScaling
+        mxCoords[:, 2] = childLocations[:, 2]*s_a + parentLocations[:, 2] + s_b + offset[2]
+    return rowTimes, mxCoords, mxOffsets
+
+# Locations of packed node courses (waypoints sorted by time within each node) at the (node, time) query
+# rows, following NodeCourse.get_location: exact waypoint times return the first waypoint with that time,
+# times out of the course return its first or last location and times in between are interpolated
+def interpolate_courses(times, coords, offsets, queryNodes, queryTimes):
+    counts = np.diff(offsets)
+    nodeIds = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    # (node, time rank) integer keys searched exactly, ranks are taken over waypoint and query times
+    uniqueTimes = np.unique(np.concatenate((times, queryTimes)))
+    stride = len(uniqueTimes) + 1
+    keys = nodeIds * stride + np.searchsorted(uniqueTimes, times)
+    queryKeys = queryNodes * stride + np.searchsorted(uniqueTimes, queryTimes)
+    first = offsets[:-1][queryNodes]
+    before = np.searchsorted(keys, queryKeys, side='left') - first
+    index = np.searchsorted(keys, queryKeys, side='right') - first
+    n = counts[queryNodes]
+    segment = first + np.clip(index, 1, np.maximum(n - 1, 1))
+    p1 = coords[segment-1]
+    p2 = coords[np.minimum(segment, len(times) - 1)]
+    interval = times[np.minimum(segment, len(times) - 1)] - times[segment-1]
+    t3 = queryTimes - times[segment-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        locations = p1 + (p2-p1)*(t3/interval)[:, None]
+    start = index == 0
+    locations[start] = coords[first[start]]
+    end = index >= n
+    locations[end] = coords[first[end] + n[end] - 1]
+    exact = before < index
+    locations[exact] = coords[first[exact] + before[exact]]
+    return locations
+
+# Course of a parent node, or the static origin when there is no parent scenario
+def parent_course(parentScenario=None, node=0):
+    if parentScenario is None:
+        return NodeCourse([0], [[0, 0]])
+    return NodeCourse(*parentScenario.get_node(node))
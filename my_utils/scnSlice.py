@@ -0,0 +1,211 @@
+import os
+import numpy as np
+from my_utils.bmReader import BmScenario, MovementsReader, parse_waypoints, read_params
+from my_utils.scnCache import file_signature, load_cached_scenario
+from my_utils.scnMerge import interpolate_courses
+from my_utils.profiler import g_profiler
+
+# Loading of a slice of a scenario: a subset of its nodes and/or a time window [t0, t1]. When the binary
+# cache is up to date the slice is taken from the memory-mapped arrays, otherwise only the selected lines
+# of the .movements file are read using a per node byte offset index (built once and saved next to the
+# file as '<scenario>.movements.index.npz'). Courses are trimmed to the time window with interpolated
+# waypoints at t0 and t1, so memory and load time follow the size of the slice.
+INDEX_SUFFIX = ".index.npz"
+INDEX_CHUNK = 1 << 24
+
+# Parses a node list such as "0-200,305,400-410" into a sorted array of node numbers
+def parse_node_list(spec):
+    nodes = []
+    for item in spec.split(','):
+        bounds = item.split('-')
+        if len(bounds) == 1:
+            nodes.append(int(bounds[0]))
+        elif len(bounds) == 2:
+            nodes.extend(range(int(bounds[0]), int(bounds[1]) + 1))
+        else:
+            raise ValueError("invalid node range '{}'".format(item))
+    return np.unique(np.array(nodes, dtype=np.int64))
+
+# Stores the value of a slice option ('--nodes', '--t0' or '--t1') in 'selection', the load_slice
+# arguments of the command line (created when None). Raises ValueError when the value is missing or
+# invalid or when the window is empty. Returns the selection
+def slice_option(option, value, selection=None):
+    if selection is None:
+        selection = dict(nodes=None, t0=None, t1=None)
+    try:
+        if option == '--nodes':
+            selection['nodes'] = parse_node_list(value)
+        else:
+            selection[option[2:]] = float(value)
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("a {} is expected after '{}' option".format("node list" if option == '--nodes' else "time", option))
+    check_window(selection['t0'], selection['t1'])
+    return selection
+
+# A window must last some time, with t0 == t1 every course would be two waypoints at the same time
+def check_window(t0, t1):
+    if t0 is not None and t1 is not None and t0 >= t1:
+        raise ValueError("the time window is empty, t1 must be after t0 (t0={:g}, t1={:g})".format(t0, t1))
+
+# Byte offsets of the node lines of a .movements file: node n is in bytes starts[n]:ends[n]
+class LineIndex:
+    def __init__ (self, starts, ends, is3D):
+        self.starts = starts
+        self.ends = ends
+        self.is3D = is3D
+        self.node_count = len(starts)
+
+# Scans the file for line breaks in large binary chunks, comment ('#') and blank lines are not node lines
+def build_line_index(movementsFile):
+    size = os.path.getsize(movementsFile)
+    breaks = []
+    with open(movementsFile, 'rb') as bmFile:
+        position = 0
+        while True:
+            chunk = bmFile.read(INDEX_CHUNK)
+            if not chunk:
+                break
+            breaks.append(np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10) + position)
+            position += len(chunk)
+        breaks = np.concatenate(breaks) if breaks else np.zeros(0, dtype=np.int64)
+        starts = np.concatenate(([0], breaks + 1)).astype(np.int64)
+        ends = np.concatenate((breaks, [size])).astype(np.int64)
+        data = np.memmap(movementsFile, dtype=np.uint8, mode='r') if size > 0 else np.zeros(0, dtype=np.uint8)
+        nonEmpty = ends > starts
+        firstBytes = np.zeros(len(starts), dtype=np.uint8)
+        firstBytes[nonEmpty] = data[starts[nonEmpty]]
+        isNode = nonEmpty & (firstBytes != ord('#'))
+        # lines starting with white space are checked one by one
+        for k in np.flatnonzero(isNode & np.isin(firstBytes, np.frombuffer(b" \t\r\f\v", dtype=np.uint8))).tolist():
+            bmFile.seek(starts[k])
+            isNode[k] = bmFile.read(ends[k] - starts[k]).strip() != b""
+        is3D = False
+        if len(starts) > 0:
+            bmFile.seek(0)
+            is3D = bmFile.read(ends[0]).strip() == b"#3D"
+    return LineIndex(starts[isNode], ends[isNode], is3D)
+
+def get_index_file(movementsFile):
+    return movementsFile + INDEX_SUFFIX
+
+# Line index of a .movements file, read from its index file when it is up to date or built and saved
+def load_line_index(movementsFile):
+    indexFile = get_index_file(movementsFile)
+    signature = file_signature(movementsFile)
+    try:
+        with np.load(indexFile) as saved:
+            if saved["signature"].tolist() == signature:
+                return LineIndex(saved["starts"], saved["ends"], bool(saved["is3D"]))
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_line_index(movementsFile)
+    tmpName = "{}.tmp{}.npz".format(indexFile, os.getpid())
+    try:
+        np.savez(tmpName, starts=index.starts, ends=index.ends, is3D=index.is3D, signature=np.array(signature, dtype=np.int64))
+        os.replace(tmpName, indexFile)
+    except OSError:
+        print("warning: could not write line index {}".format(indexFile))
+    return index
+
+# Packed arrays of the given nodes (indexes of the scenario nodes)
+def select_nodes(scenario, nodes):
+    counts = np.diff(scenario.offsets)[nodes]
+    offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rows = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts) + np.repeat(scenario.offsets[:-1][nodes], counts)
+    selected = BmScenario(np.asarray(scenario.times[rows]), np.asarray(scenario.coords[rows]), offsets, scenario.is3D,
+                          np.asarray(scenario.node_ids[nodes]), scenario.params)
+    selected.file_node_count = scenario.file_node_count
+    return selected
+
+# Trims the node courses to [t0, t1] (None for an open end). Waypoints within the window are kept and a
+# waypoint interpolated as NodeCourse.get_location does is added at t0 and t1 when there is none at that time
+def trim_scenario(scenario, t0=None, t1=None):
+    check_window(t0, t1)
+    if t0 is None and t1 is None:
+        return scenario
+    offsets = np.asarray(scenario.offsets)
+    nodeIds = np.repeat(np.arange(scenario.node_count, dtype=np.int64), np.diff(offsets))
+    # waypoints stably sorted by time within each node, as NodeCourse does
+    order = np.lexsort((scenario.times, nodeIds))
+    times = np.asarray(scenario.times)[order]
+    coords = np.asarray(scenario.coords)[order]
+    keep = np.ones(len(times), dtype=bool)
+    if t0 is not None:
+        keep &= times >= t0
+    if t1 is not None:
+        keep &= times <= t1
+    rows = [(nodeIds[keep], times[keep], coords[keep])]
+    for bound in (t0, t1):
+        if bound is None:
+            continue
+        # nodes without a waypoint exactly at the bound get an interpolated one
+        exact = np.zeros(scenario.node_count, dtype=bool)
+        exact[nodeIds[times == bound]] = True
+        boundNodes = np.flatnonzero(~exact)
+        boundTimes = np.full(len(boundNodes), float(bound))
+        rows.append((boundNodes, boundTimes, interpolate_courses(times, coords, offsets, boundNodes, boundTimes)))
+    rowNodes, rowTimes, rowCoords = (np.concatenate(column) for column in zip(*rows))
+    # the original waypoints come first, so the stable sort keeps the order of waypoints sharing a time
+    order = np.lexsort((rowTimes, rowNodes))
+    trimmedOffsets = np.zeros(scenario.node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rowNodes, minlength=scenario.node_count), out=trimmedOffsets[1:])
+    trimmed = BmScenario(rowTimes[order], rowCoords[order], trimmedOffsets, scenario.is3D, scenario.node_ids, scenario.params)
+    trimmed.file_node_count = scenario.file_node_count
+    return trimmed
+
+# Reads the given node lines (file node numbers) of a .movements file through its line index
+def read_node_lines(movementsFile, nodes):
+    index = load_line_index(movementsFile)
+    nodes = nodes[nodes < index.node_count] if nodes is not None else np.arange(index.node_count)
+    wpSize = 4 if index.is3D else 3
+    times, coords, counts, nodeIds = [], [], [], []
+    with open(movementsFile, 'rb') as bmFile:
+        for n in nodes.tolist():
+            bmFile.seek(index.starts[n])
+            waypoints = parse_waypoints(n, bmFile.read(index.ends[n] - index.starts[n]).decode().split(), wpSize)
+            if waypoints is not None:
+                times.append(waypoints[:, 0])
+                coords.append(waypoints[:, 1:])
+                counts.append(len(waypoints))
+                nodeIds.append(n)
+    g_profiler.count("waypoints parsed", sum(counts))
+    return packed_scenario(times, coords, counts, nodeIds, index.is3D, index.node_count)
+
+def packed_scenario(times, coords, counts, nodeIds, is3D, fileNodeCount):
+    dims = 3 if is3D else 2
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.array(counts, dtype=np.int64), out=offsets[1:])
+    scenario = BmScenario(np.concatenate(times) if times else np.zeros(0), np.concatenate(coords) if coords else np.zeros((0, dims)),
+                          offsets, is3D, np.array(nodeIds, dtype=np.int64))
+    scenario.file_node_count = fileNodeCount
+    return scenario
+
+# Loads the nodes 'nodes' (file node numbers, all when None) of a scenario trimmed to the window [t0, t1]
+def load_slice(movementsFile, paramsFile=None, nodes=None, t0=None, t1=None, useCache=True):
+    with g_profiler.stage("load slice"):
+        return _load_slice(movementsFile, paramsFile, nodes, t0, t1, useCache)
+
+def _load_slice(movementsFile, paramsFile, nodes, t0, t1, useCache):
+    check_window(t0, t1)
+    scenario = load_cached_scenario(movementsFile, paramsFile) if useCache else None
+    if scenario is not None:
+        if nodes is not None:
+            scenario = select_nodes(scenario, np.flatnonzero(np.isin(scenario.node_ids, nodes)))
+    elif movementsFile.endswith(".gz"):
+        # compressed files can not be indexed, they are read sequentially keeping only the selected nodes
+        reader = MovementsReader(movementsFile)
+        times, coords, counts, nodeIds = [], [], [], []
+        selected = None if nodes is None else set(nodes.tolist())
+        for n, nodeTimes, nodeCoords in reader:
+            if selected is None or n in selected:
+                times.append(nodeTimes)
+                coords.append(nodeCoords)
+                counts.append(len(nodeTimes))
+                nodeIds.append(n)
+        scenario = packed_scenario(times, coords, counts, nodeIds, reader.is3D, reader.node_count)
+    else:
+        scenario = read_node_lines(movementsFile, nodes)
+    if paramsFile is not None and not scenario.params and os.path.exists(paramsFile):
+        scenario.params = read_params(paramsFile)
+    return trim_scenario(scenario, t0, t1)
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Statistics index of a scenario: per node minimum and maximum of each axis, start and end times, number
+# of waypoints and maximum speed, computed in one vectorized pass over the packed waypoints (or loaded from
+# the binary cache). Global values are derived from the per node arrays.
+STATS_ARRAYS = ("node_min", "node_max", "start_times", "end_times", "waypoint_counts", "max_speeds")
+
+class ScenarioStats:
+    def __init__ (self, node_min, node_max, start_times, end_times, waypoint_counts, max_speeds):
+        self.node_min = node_min
+        self.node_max = node_max
+        self.start_times = start_times
+        self.end_times = end_times
+        self.waypoint_counts = waypoint_counts
+        self.max_speeds = max_speeds
+        self.node_count = len(start_times)
+        self.dims = node_min.shape[1]
+        if self.node_count > 0:
+            self.min = node_min.min(axis=0)
+            self.max = node_max.max(axis=0)
+            self.start_time = float(start_times.min())
+            self.end_time = float(end_times.max())
+            self.max_speed = float(max_speeds.max())
+        else:
+            self.min = self.max = np.zeros(self.dims)
+            self.start_time = self.end_time = self.max_speed = 0.0
+        self.waypoint_count = int(waypoint_counts.sum())
+
+    # Min and max of an axis (0 for x, 1 for y, 2 for z)
+    def get_range(self, axis):
+        return float(self.min[axis]), float(self.max[axis])
+
+# Computes the statistics of packed waypoints, nodes are expected to have at least one waypoint
+def compute_stats(times, coords, offsets):
+    times = np.asarray(times)
+    coords = np.asarray(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    first = offsets[:-1]
+    counts = np.diff(offsets)
+    if len(first) == 0:
+        empty = np.zeros((0, coords.shape[1]))
+        return ScenarioStats(empty, empty, np.zeros(0), np.zeros(0), counts, np.zeros(0))
+    # Speed of the segment ending at each waypoint, zero for the first waypoint of a node and for waypoints
+    # sharing the same time
+    speeds = np.zeros(len(times))
+    if len(times) > 1:
+        timeSpan = np.diff(times)
+        moving = timeSpan > 0
+        moving[first[1:] - 1] = False
+        distance = np.sqrt(np.sum(np.diff(coords, axis=0)[moving]**2, axis=1))
+        speeds[1:][moving] = distance / timeSpan[moving]
+    return ScenarioStats(np.minimum.reduceat(coords, first, axis=0), np.maximum.reduceat(coords, first, axis=0),
+                         np.minimum.reduceat(times, first), np.maximum.reduceat(times, first), counts,
+                         np.maximum.reduceat(speeds, first))
+
+# Copy of the .params values used for plotting with the x, y (and z) extents completed from the statistics
+# when they are missing from the .params file or smaller than the area covered by the nodes. The lower
+# bounds 'xmin', 'ymin' (and 'zmin') are 0, or the smallest coordinate when some nodes go below 0
+def plot_extents(params, stats):
+    figParams = dict(params)
+    for axis, key in enumerate(('x', 'y', 'z')[:stats.dims]):
+        value = figParams.get(key)
+        if not isinstance(value, float) or value < stats.max[axis]:
+            figParams[key] = float(stats.max[axis])
+        figParams[key + 'min'] = min(0.0, float(stats.min[axis]))
+    return figParams
+
+# Text report of the statistics, with one line per node when 'perNode' is set (nodeIds are the node numbers in the file)
+def format_stats(stats, nodeIds=None, perNode=True):
+    axes = "xyz"[:stats.dims]
+    lines = ["\t{} nodes, {} waypoints".format(stats.node_count, stats.waypoint_count),
+             "\ttime: {:g}s to {:g}s".format(stats.start_time, stats.end_time)]
+    for axis, name in enumerate(axes):
+        lines.append("\t{}: {:g} to {:g}".format(name, *stats.get_range(axis)))
+    lines.append("\tmax speed: {:g}".format(stats.max_speed))
+    if perNode and stats.node_count > 0:
+        if nodeIds is None:
+            nodeIds = np.arange(stats.node_count)
+        lines.append("")
+        lines.append("node\twaypoints\tstart\tend\t" + "\t".join("{0}min\t{0}max".format(name) for name in axes) + "\tmax speed")
+        for i, n in enumerate(nodeIds.tolist()):
+            ranges = "\t".join("{:g}\t{:g}".format(stats.node_min[i, axis], stats.node_max[i, axis]) for axis in range(stats.dims))
+            lines.append("{}\t{}\t{:g}\t{:g}\t{}\t{:g}".format(n, stats.waypoint_counts[i], stats.start_times[i], stats.end_times[i], ranges, stats.max_speeds[i]))
+    return "\n".join(lines)
@@ -0,0 +1,129 @@
+from array import array
+import gzip, threading, time
+import numpy as np
+from my_utils.bmReader import BmScenario, parse_waypoints
+
+# Incremental reader of a .movements file. The node lines are parsed by a background thread into growing
+# columnar buffers, snapshot() returns a BmScenario with the nodes parsed so far so that they can be shown
+# while the rest of the file is read. With 'follow' the end of the file is polled for new lines, as 'tail -f'
+# does, for scenarios that are still being written by their generator.
+# Every 'refreshPeriod' seconds the reader thread also builds a snapshot with its statistics and
+# interpolation engine (over 'engine_dims' coordinates), get_prepared() hands them over ready to display.
+class ScenarioStream:
+    def __init__ (self, filename, follow=False, pollInterval=0.5, refreshPeriod=1.0):
+        self.filename = filename
+        self.follow = follow
+        self.pollInterval = pollInterval
+        self.refresh_period = refreshPeriod
+        self.engine_dims = None # all the coordinates by default
+        self.is3D = None
+        self.version = 0 # incremented each time nodes are added
+        self.done = False
+        self.error = None
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__times = array('d')
+        self.__coords = array('d')
+        self.__counts = array('q')
+        self.__nodeIds = array('q')
+        self.__fileNodeCount = 0
+        self.__prepared = None
+        self.__nextPrepare = time.monotonic() + refreshPeriod
+        self.__bmFile = gzip.open(filename, 'rt') if filename.endswith(".gz") else open(filename, 'r')
+        self.__thread = threading.Thread(target=self.__run, name="movements-reader", daemon=True)
+        self.__thread.start()
+
+    # Complete lines of the file, waiting for more data at the end of the file when following it
+    def __lines(self):
+        pending = ""
+        while not self.__stopping.is_set():
+            line = self.__bmFile.readline()
+            if line.endswith("\n"):
+                yield pending + line
+                pending = ""
+            elif line:
+                pending += line # partial line, the rest has not been written yet
+            elif not self.follow:
+                if pending:
+                    yield pending
+                return
+            else:
+                # nodes parsed before the end of the file are prepared while waiting for more
+                self.__prepare()
+                self.__stopping.wait(self.pollInterval)
+
+    def __run(self):
+        try:
+            with self.__bmFile:
+                n = -1
+                for bmLine in self.__lines():
+                    bmLine = bmLine.strip()
+                    if self.is3D is None:
+                        self.is3D = bmLine == "#3D"
+                        if self.is3D:
+                            continue
+                    if bmLine == "" or bmLine.startswith('#'):
+                        continue
+                    n += 1
+                    waypoints = parse_waypoints(n, bmLine.split(), 4 if self.is3D else 3)
+                    with self.__lock:
+                        self.__fileNodeCount = n + 1
+                        if waypoints is not None:
+                            self.__times.frombytes(np.ascontiguousarray(waypoints[:, 0]).tobytes())
+                            self.__coords.frombytes(np.ascontiguousarray(waypoints[:, 1:]).tobytes())
+                            self.__counts.append(len(waypoints))
+                            self.__nodeIds.append(n)
+                            self.version += 1
+                    if time.monotonic() >= self.__nextPrepare:
+                        self.__prepare()
+            self.__prepare()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def get_node_count(self):
+        return len(self.__counts)
+
+    # Waits until at least one node has been parsed or the file has been read, returns the number of nodes
+    def wait_first_node(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.get_node_count() == 0 and not self.done:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        return self.get_node_count()
+
+    # BmScenario of the nodes parsed so far (the buffers are copied, parsing goes on in the background)
+    def snapshot(self):
+        with self.__lock:
+            times = np.array(self.__times, dtype=np.float64)
+            coords = np.array(self.__coords, dtype=np.float64)
+            counts = np.array(self.__counts, dtype=np.int64)
+            nodeIds = np.array(self.__nodeIds, dtype=np.int64)
+            fileNodeCount = self.__fileNodeCount
+            version = self.version
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        dims = 3 if self.is3D else 2
+        scenario = BmScenario(times, coords.reshape(-1, dims), offsets, bool(self.is3D), nodeIds)
+        scenario.file_node_count = fileNodeCount
+        scenario.version = version
+        return scenario
+
+    # Snapshot of the nodes parsed so far with its statistics and engine, built in the reader thread
+    def __prepare(self):
+        self.__nextPrepare = time.monotonic() + self.refresh_period
+        prepared = self.__prepared
+        if prepared is not None and prepared[0].version == self.version:
+            return
+        scenario = self.snapshot()
+        scenario.get_stats()
+        self.__prepared = (scenario, scenario.get_engine(self.engine_dims))
+
+    # Latest (scenario, engine) prepared by the reader thread, None before the first one
+    def get_prepared(self):
+        return self.__prepared
+
+    def stop(self):
+        self.__stopping.set()
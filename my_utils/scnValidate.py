@@ -0,0 +1,42 @@
+import numpy as np
+
+# Consistency checks of a loaded scenario, run without drawing anything. Malformed node lines are
+# reported by the parser while reading, the checks below look at the waypoints and at the .params values:
+# non finite numbers, negative or decreasing times within a node, waypoints outside the .params area or
+# after its duration, and a node count different from the 'nn' value. For a slice of the scenario
+# ('isSlice', see scnSlice.load_slice) the nodes that were not selected are not reported as unreadable.
+# Returns a list of problem messages.
+def validate_scenario(scenario, isSlice=False):
+    problems = []
+    times = np.asarray(scenario.times)
+    coords = np.asarray(scenario.coords)
+    offsets = np.asarray(scenario.offsets)
+    nodeIds = np.asarray(scenario.node_ids)
+    owners = np.repeat(np.arange(scenario.node_count), np.diff(offsets))
+    skipped = scenario.file_node_count - scenario.node_count
+    if skipped > 0 and not isSlice:
+        problems.append("{} node lines could not be read".format(skipped))
+    nonFinite = ~np.isfinite(times) | ~np.all(np.isfinite(coords), axis=1)
+    report_nodes(problems, "non finite time or coordinate", nodeIds, owners[nonFinite])
+    report_nodes(problems, "negative time", nodeIds, owners[times < 0])
+    if len(times) > 1:
+        decreasing = np.flatnonzero((np.diff(times) < 0) & (owners[1:] == owners[:-1]))
+        report_nodes(problems, "waypoint times not in increasing order", nodeIds, owners[decreasing])
+    params = scenario.params
+    for axis, key in enumerate(("x", "y", "z")[:scenario.dims]):
+        if isinstance(params.get(key), float):
+            outside = (coords[:, axis] < 0) | (coords[:, axis] > params[key])
+            report_nodes(problems, "{} outside the area [0, {:g}]".format(key, params[key]), nodeIds, owners[outside])
+    if isinstance(params.get("duration"), float):
+        report_nodes(problems, "waypoints after the duration ({:g}s)".format(params["duration"]), nodeIds, owners[times > params["duration"]])
+    if isinstance(params.get("nn"), float) and int(params["nn"]) != scenario.file_node_count:
+        problems.append("{} node lines, the .params file gives nn={}".format(scenario.file_node_count, int(params["nn"])))
+    return problems
+
+# Adds a message with the number of waypoints of a problem and the first nodes where it occurs
+def report_nodes(problems, description, nodeIds, owners, shown=10):
+    if len(owners) == 0:
+        return
+    nodes = nodeIds[np.unique(owners)].tolist()
+    listed = ", ".join(map(str, nodes[:shown])) + (", ..." if len(nodes) > shown else "")
+    problems.append("{}: {} waypoints in {} nodes ({})".format(description, len(owners), len(nodes), listed))
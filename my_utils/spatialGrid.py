@@ -0,0 +1,80 @@
+import numpy as np
+from my_utils.bulkWriter import BulkWriter, output_filename
+
+# Uniform grid index over the node locations of a frame, used to find all the node pairs within a range R
+# in near linear time. Nodes are binned in cells of side R and sorted by cell, so a pair within range is
+# always in the same or in adjacent cells; only half of the neighbour cells are visited so that each pair
+# of cells is compared once.
+class SpatialGrid:
+    def __init__ (self, loctns, radius):
+        self.loctns = np.asarray(loctns, dtype=np.float64)
+        self.radius = float(radius)
+        self.node_count, self.dims = self.loctns.shape
+        # Cell coordinates, shifted by one so that the neighbours of any cell have non-negative coordinates
+        if self.node_count > 0:
+            cells = np.floor((self.loctns - self.loctns.min(axis=0)) / self.radius).astype(np.int64) + 1
+            self.__shape = cells.max(axis=0) + 2
+        else:
+            cells = np.zeros((0, self.dims), dtype=np.int64)
+            self.__shape = np.ones(self.dims, dtype=np.int64)
+        self.__cells = cells
+        keys = np.ravel_multi_index(tuple(cells.T), tuple(self.__shape))
+        self.__order = np.argsort(keys, kind='stable')
+        self.__keys = keys[self.__order]
+
+    # Cell offsets visited from every cell: itself and the neighbours that come after it in key order
+    def __forward_offsets(self):
+        offsets = np.array(np.meshgrid(*[[-1, 0, 1]] * self.dims, indexing='ij')).reshape(self.dims, -1).T
+        keyOffsets = np.ravel_multi_index(tuple((offsets + 1).T), tuple(self.__shape)) - np.ravel_multi_index((1,) * self.dims, tuple(self.__shape))
+        return offsets[keyOffsets >= 0], keyOffsets[keyOffsets >= 0]
+
+    # (P, 2) array of the node pairs (i < j) whose distance is not greater than the radius
+    def pairs(self):
+        if self.node_count < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        found = []
+        keys = self.__keys
+        for offset, keyOffset in zip(*self.__forward_offsets()):
+            # range of sorted nodes in the neighbour cell of every node
+            start = np.searchsorted(keys, keys + keyOffset, side='left')
+            end = np.searchsorted(keys, keys + keyOffset, side='right')
+            if keyOffset == 0:
+                start = np.arange(1, self.node_count + 1) # same cell, only the nodes after it
+            counts = np.maximum(end - start, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            first = np.repeat(np.arange(self.node_count), counts)
+            second = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+            i = self.__order[first]
+            j = self.__order[second]
+            distance2 = np.sum((self.loctns[i] - self.loctns[j])**2, axis=1)
+            inRange = distance2 <= self.radius**2
+            found.append(np.column_stack((i[inRange], j[inRange])))
+        if not found:
+            return np.zeros((0, 2), dtype=np.int64)
+        pairs = np.concatenate(found)
+        pairs.sort(axis=1)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+# Node pairs within 'radius' at the (N, D) locations of a frame
+def neighbor_pairs(loctns, radius):
+    return SpatialGrid(loctns, radius).pairs()
+
+# Writes the contacts (node pairs within 'radius') of every frame as CSV lines "time,node,node", 'nodeIds'
+# gives the node numbers written for the engine nodes. Frames are computed in blocks of 'blockFrames'.
+# Returns the number of contacts written
+def export_contacts(outFile, engine, frameTimes, radius, nodeIds=None, compress=False, blockFrames=64):
+    if nodeIds is None:
+        nodeIds = np.arange(engine.node_count)
+    contactCount = 0
+    with BulkWriter(output_filename(outFile, compress), compress) as contactsFile:
+        contactsFile.write("time,node1,node2\n")
+        for f in range(0, len(frameTimes), blockFrames):
+            blockTimes = frameTimes[f:f+blockFrames]
+            for frameTime, loctns in zip(blockTimes.tolist(), engine.positions_block(blockTimes)):
+                pairs = nodeIds[neighbor_pairs(loctns, radius)]
+                prefix = str(frameTime) + ","
+                contactsFile.write("".join(prefix + "{},{}\n".format(i, j) for i, j in pairs.tolist()))
+                contactCount += len(pairs)
+    return contactCount
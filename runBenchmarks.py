@@ -0,0 +1,215 @@
+'''
+* Copyright (c) 2019 - 2020 Oscar Bautista
+*
+* This program is free software; you can redistribute it and/or modify it
+* under the terms of the GNU General Public License version 2 as published
+* by the Free Software Foundation.
+*
+* DESCRIPTION:
+* Benchmarks the hot paths of the tools (parsing, frame generation, position export, NodeCourse
+* interpolation, scenario merge, ns2 conversion and headless rendering) on a synthetic BonnMotion scenario. Results, including
+* the peak memory of each stage, are written to a JSON file that can be compared with a previous run.
+*
+* AUTHOR: Oscar Bautista <obaut004@fiu.edu>
+'''
+
+import sys, os, json, time, platform, shutil, subprocess, tempfile, tracemalloc
+import numpy as np
+from my_utils.scnGenerator import generate_scenario, write_scenario
+from my_utils.bmReader import read_movements
+from my_utils.scnCache import load_scenario
+from my_utils.locationEngine import frame_times
+from my_utils.nodeCourse import NodeCourse
+from my_utils.scnMerge import merge_scenario, parent_course
+from my_utils.bulkWriter import BulkWriter
+from my_utils.ns2Mobility import convert_node
+from my_utils.positionExport import export_positions
+
+RESULTS_VERSION = 1
+
+def usage():
+    print ("\nUsage:\n python3 runBenchmarks.py [--nodes N] [--waypoints W] [--duration S] [--3d] [--interval S] [--frames F]")
+    print ("                          [--repeat R] [--only name,...] [--seed N] [-o results.json] [--compare baseline.json] [--keep DIR]\n")
+    print ("  --nodes N\t\tNumber of nodes of the synthetic scenario (default 1000).")
+    print ("  --waypoints W\t\tWaypoints per node (default 50).")
+    print ("  --duration S\t\tScenario duration in seconds (default 600).")
+    print ("  --3d\t\t\tGenerate a 3D scenario.")
+    print ("  --interval S\t\tScenario seconds between generated frames (default 0.5).")
+    print ("  --frames F\t\tNumber of frames rendered by the render benchmark (default 40).")
+    print ("  --repeat R\t\tRuns of each benchmark, the fastest is reported (default 3).")
+    print ("  --only name,...\tRun only these benchmarks: " + ", ".join(name for name, _ in BENCHMARKS) + ".")
+    print ("  -o results.json\tJSON results file (default benchmark_results.json).")
+    print ("  --compare FILE\tShow the time ratio of each benchmark against a previous results file.")
+    print ("  --keep DIR\t\tGenerate the scenario in DIR and keep it (a temporary directory by default).\n")
+
+# Each benchmark receives the benchmark context and returns the number of items processed (waypoints,
+# frames, ...) and the name of the items
+def bench_parse(ctx):
+    scenario = read_movements(ctx["movements"])
+    return len(scenario.times), "waypoints"
+
+def bench_cache_load(ctx):
+    scenario = load_scenario(ctx["movements"], ctx["params"])
+    # the memory-mapped arrays are read once so that the load is complete
+    for column in (scenario.times, scenario.coords):
+        np.sum(column)
+    return len(scenario.times), "waypoints"
+
+def bench_frames(ctx):
+    engine = ctx["scenario"].get_engine()
+    frameTimes = frame_times(0.0, ctx["duration"], ctx["interval"])
+    for f in range(0, len(frameTimes), 64):
+        engine.positions_block(frameTimes[f:f+64])
+    return len(frameTimes), "frames"
+
+def bench_positions(ctx):
+    frameTimes = frame_times(0.0, ctx["duration"], ctx["interval"])
+    export_positions(os.path.join(ctx["dir"], "bench_positions.npy"), ctx["scenario"].get_engine(), frameTimes)
+    return len(frameTimes), "frames"
+
+def bench_node_course(ctx):
+    scenario = ctx["scenario"]
+    queries = np.linspace(0, ctx["duration"], 100).tolist()
+    calls = 0
+    for n in range(min(scenario.node_count, 200)):
+        course = NodeCourse(*scenario.get_node(n))
+        for t in queries:
+            course.get_location(t)
+        calls += len(queries)
+    return calls, "locations"
+
+def bench_merge(ctx):
+    scenario = ctx["scenario"]
+    mxTimes, mxCoords, mxOffsets = merge_scenario(scenario, parent_course(scenario, 0), [0, 0, 0], scenario.dims == 3)
+    return len(mxTimes), "waypoints"
+
+def bench_ns2(ctx):
+    scenario = ctx["scenario"]
+    with BulkWriter(os.path.join(ctx["dir"], "bench.ns_movements")) as ns2File:
+        for n_ns2, (n, nodeTimes, nodeLocations) in enumerate(scenario.iter_nodes()):
+            ns2File.write(convert_node(n, n_ns2, nodeTimes, nodeLocations, scenario.is3D)[0])
+    return scenario.node_count, "nodes"
+
+def bench_render(ctx):
+    # The renderer needs matplotlib (Agg canvas), it is imported here so the other benchmarks run without it
+    from my_utils.frameExport import FrameRenderer
+    scenario = ctx["scenario"]
+    renderer = FrameRenderer(ctx["movements"], ctx["params"], "benchmark", scenario.dims == 3, {}, 80, True)
+    frameTimes = frame_times(0.0, ctx["duration"], ctx["interval"])[:ctx["frames"]]
+    renderer.render(frameTimes)
+    return len(frameTimes), "frames"
+
+BENCHMARKS = [("parse", bench_parse), ("cache_load", bench_cache_load), ("frames", bench_frames), ("positions", bench_positions),
+              ("node_course", bench_node_course),
+              ("merge", bench_merge), ("ns2", bench_ns2), ("render", bench_render)]
+
+# Runs a benchmark 'repeat' times and returns the fastest time, the peak memory allocated is measured in an
+# additional run since tracing the allocations slows down the benchmarks
+def run_benchmark(function, ctx, repeat):
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        items, unit = function(ctx)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        function(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_memory": peak, "items": items, "unit": unit, "rate": items / best if best > 0 else None}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baselineFile):
+    with open(baselineFile, 'r') as f:
+        baseline = json.load(f)
+    print("\nComparison with {} (commit {}):".format(baselineFile, baseline.get("commit")))
+    print("\t{:<12}{:>12}{:>12}{:>9}".format("benchmark", "baseline s", "current s", "ratio"))
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or "seconds" not in previous or "seconds" not in result:
+            continue
+        print("\t{:<12}{:>12.4f}{:>12.4f}{:>8.2f}x".format(name, previous["seconds"], result["seconds"], result["seconds"] / previous["seconds"]))
+
+def main():
+    # Options
+    config = {"nodes": 1000, "waypoints": 50, "duration": 600.0, "is3D": False, "interval": 0.5, "frames": 40, "repeat": 3, "seed": 0}
+    only = None
+    outFile = "benchmark_results.json"
+    baselineFile = None
+    keepDir = None
+    argIter = iter(sys.argv[1:])
+    try:
+        for arg in argIter:
+            if arg in ('--nodes', '--waypoints', '--frames', '--repeat', '--seed'):
+                config[arg[2:]] = int(next(argIter))
+            elif arg in ('--duration', '--interval'):
+                config[arg[2:]] = float(next(argIter))
+            elif arg == '--3d':
+                config["is3D"] = True
+            elif arg == '--only':
+                only = next(argIter).split(',')
+            elif arg == '-o':
+                outFile = next(argIter)
+            elif arg == '--compare':
+                baselineFile = next(argIter)
+            elif arg == '--keep':
+                keepDir = next(argIter)
+            else:
+                usage()
+                sys.exit(1)
+    except (StopIteration, ValueError):
+        usage()
+        sys.exit(1)
+
+    workDir = keepDir if keepDir is not None else tempfile.mkdtemp(prefix="bmbench")
+    os.makedirs(workDir, exist_ok=True)
+    try:
+        scnName = os.path.join(workDir, "synthetic")
+        print("Generating a {} scenario of {} nodes with {} waypoints per node...".format("3D" if config["is3D"] else "2D", config["nodes"], config["waypoints"]))
+        times, coords, offsets = generate_scenario(config["nodes"], config["waypoints"], config["duration"], config["is3D"], seed=config["seed"])
+        write_scenario(scnName, times, coords, offsets, config["duration"], seed=config["seed"])
+        ctx = {"dir": workDir, "movements": scnName + ".movements", "params": scnName + ".params", "duration": config["duration"],
+               "interval": config["interval"], "frames": config["frames"]}
+        # the scenario used by the in-memory benchmarks is loaded once (this also writes the binary cache)
+        ctx["scenario"] = load_scenario(ctx["movements"], ctx["params"])
+        results = {}
+        print("\t{:<12}{:>10}{:>14}{:>24}".format("benchmark", "seconds", "peak memory", "rate"))
+        for name, function in BENCHMARKS:
+            if only is not None and name not in only:
+                continue
+            try:
+                result = run_benchmark(function, ctx, config["repeat"])
+            except ImportError as e:
+                results[name] = {"skipped": str(e)}
+                print("\t{:<12}skipped: {}".format(name, e))
+                continue
+            results[name] = result
+            print("\t{:<12}{:>10.4f}{:>12.1f}MB{:>14.0f} {}/s".format(name, result["seconds"], result["peak_memory"] / 2**20, result["rate"] or 0, result["unit"]))
+    finally:
+        if keepDir is None:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    report = {"version": RESULTS_VERSION, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+              "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "config": config,
+              "results": results}
+    try:
+        import resource
+        report["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # kilobytes on Linux
+    except ImportError:
+        pass
+    with open(outFile, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("\n{} created successfully".format(outFile))
+    if baselineFile is not None:
+        compare(results, baselineFile)
+    print('')
+
+if __name__ == '__main__':
+    main()
@@ -10,181 +10,363 @@
 *
 * AUTHOR: Oscar Bautista <obaut004@fiu.edu>
 '''
-import math, sys
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from mpl_toolkits.mplot3d import Axes3D
-from my_utils import fRead
-from my_utils.netSimUtils import getPlotMargins, calculateFigDimensions, calculateZlim
+import sys, time
+from my_utils.scnCache import load_scenario
+from my_utils.scnStream import ScenarioStream
+from my_utils.bmReader import read_params
+from my_utils.scnSlice import load_slice, slice_option
+from my_utils.profiler import g_profiler, profile_option
+from my_utils.frameSource import FrameSource, Playback
+from my_utils.scnStats import plot_extents, format_stats
+from my_utils.spatialGrid import export_contacts
+from my_utils.positionExport import export_positions
+from my_utils.scnValidate import validate_scenario
+# matplotlib is only imported when a figure is rendered (see saveAnimation and showAnimation), so that the
+# module can be imported and the non rendering options (--stats, --validate, --positions, --contacts) run
+# without loading it
 
 'GLOBAL VARIABLES'
-g_interval = 0.5
-g_currentFT = 0.0
+g_interval = 0.5 # Scenario seconds between consecutive frames
+g_speed = 10.0 # Scenario seconds displayed per real second
 g_scnName = None
 g_scn3D = None
 g_drawLabel = False
+g_useCache = True
+g_blit = True
+g_saveFile = None
+g_fps = 20
+g_dpi = 80
+g_jobs = None
+g_intervalGiven = False
+g_lodThreshold = None # Node count above which the level of detail mode is used
+g_lodMode = 'density'
+g_rasterSize = 200
+g_loop = False
+g_showStats = False
+g_linkRange = None # Range within which nodes are linked in the figure and the contacts export
+g_contactsFile = None
+g_stream = False # Show the scenario while it is being read
+g_follow = False # Keep reading a .movements file that is still being written
+g_scnStream = None
+g_streamScenario = None # Latest snapshot of the streamed scenario shown
+g_refreshPeriod = 1.0 # Real seconds between updates of the streamed scenario
+g_selection = None # Nodes and time window to show, arguments of scnSlice.load_slice
+g_validate = False
+g_positionsFile = None # Interpolated positions of every frame are written to this file (see positionExport) instead of being shown
+g_scnFigure = None # Figure, playback and slider of the interactive window
+g_playback = None
+g_slider = None
+g_sliderArtists = []
+g_keyHelp = """Playback keys: space pause/resume | left/right previous/next frame | down/up -/+10s | home/end first/last frame
+               +/- double/halve speed | l loop on/off"""
+# Initial values of the options and state above, restored at the start of every main() call
+g_defaults = {name: value for name, value in globals().items() if name.startswith('g_') and name != 'g_profiler'}
 
 'DEFINITION OF FUNCTIONS'
-# Calculates the velocity vector of a node given an initial and final locations and corresponding times
-def calculateNodeVelocity(nodeTimes, nodeLocations, nVelocity):
-    nVelocity.clear()
-    if len(nodeTimes) == 1:
-        nVelocity.extend([0, 0, 0] if g_scn3D else [0, 0])
-    else:
-        try:
-            timeSpan = nodeTimes[1] - nodeTimes[0]
-            xVel = (nodeLocations[1][0] - nodeLocations[0][0])/timeSpan
-            nVelocity.append(xVel)
-            yVel = (nodeLocations[1][1] - nodeLocations[0][1])/timeSpan
-            nVelocity.append(yVel)
-            if g_scn3D:
-                zVel = (nodeLocations[1][2] - nodeLocations[0][2])/timeSpan
-                nVelocity.append (zVel)
-        except ZeroDivisionError:
-            nVelocity.extend([0, 0, 0] if g_scn3D else [0, 0])
-
-# Definition of Generator Function, provides node locations every 'interval' given the times and locationss vector
-def locationGenerator(times, locations, g_interval):
-    currentTime = times[0][0] # Assumed to be the same for all nodes
-    endTime = times[0][-1] # Assumed to be the same for all nodes
-    velocities = []
-    # Calculation of initial Velocity of each node
-    for nodeTimes, nodeLocations in zip (times, locations):
-        currentNodeVelocity = []
-        calculateNodeVelocity (nodeTimes, nodeLocations, currentNodeVelocity)
-        velocities.append(currentNodeVelocity)
-    # Generation of X, Y, Z Vectors containing location coordinates of all nodes at the current frame
-    for f in range(0, math.ceil(endTime/g_interval)+1):
-        X = []
-        Y = []
-        if g_scn3D:
-            Z = []
-        for nodeTimes, nodeLocations, nVelocity in zip(times, locations, velocities):
-            if len(nodeTimes) == 1:
-                X.append(nodeLocations[0][0])
-                Y.append(nodeLocations[0][1])
-                if g_scn3D:
-                    Z.append(nodeLocations[0][2])
-                continue
-            while currentTime >= nodeTimes[1]:
-                # Use 'del' to modify the same list that will update the times and locations variables
-                del nodeTimes[0]
-                del nodeLocations[0]
-                if (len(nodeTimes) == 1) or (currentTime < nodeTimes[1]):
-                    calculateNodeVelocity(nodeTimes, nodeLocations, nVelocity)
-                if len(nodeTimes) == 1:
-                    break
-            t = currentTime - nodeTimes[0]
-            x = nodeLocations[0][0] + nVelocity[0]*t
-            y = nodeLocations[0][1] + nVelocity[1]*t
-            X.append(x)
-            Y.append(y)
-            if g_scn3D:
-                z = nodeLocations[0][2] + nVelocity[2]*t
-                Z.append(z)
-        if g_scn3D:
-            yield X, Y, Z
-        else:
-            yield X, Y
-        currentTime += g_interval
-
-# Function to plot a frame containing nodes in the figure
-def update(loctns):
-    global g_currentFT, g_currentSet, g_labelList
-    g_currentSet.remove()
-    ax.set_xlabel("x-axis | time:{:7.2f}s".format(g_currentFT))
-    if g_scn3D:
-        g_currentSet = ax.scatter(loctns[0], loctns[1], loctns[2], s= 10, c = 'b')
-        if g_drawLabel:
-            if g_currentFT == 0:
-                for i in range (len (loctns[0])):
-                    g_labelList.append(ax.text(loctns[0][i]+5, loctns[1][i]+5, loctns[2][i], '%s' % (str(i)), zdir='x', size=8, color='k'))
-            else:
-                for i in range (len (loctns[0])):
-                    g_labelList[i].set_x(loctns[0][i]+5)
-                    g_labelList[i].set_y(loctns[1][i]+5)
-                    g_labelList[i].set_3d_properties(z=loctns[2][i], zdir='x')
-    else:
-        g_currentSet = ax.scatter(loctns[0], loctns[1], s= 10, c = 'b')
-        if g_drawLabel:
-            if g_currentFT == 0:
-                for i in range (len (loctns[0])):
-                    g_labelList.append(ax.text(loctns[0][i]+5, loctns[1][i]+5, '%s' % (str(i)), size=8, color='k'))
-            else:
-                for i in range (len (loctns[0])):
-                    g_labelList[i].set_x(loctns[0][i]+5)
-                    g_labelList[i].set_y(loctns[1][i]+5)
-    g_currentFT+= g_interval
-
-'MAIN CODE BODY STARTS HERE'
-print("")
-print("\t\t*****  BonnMotion Scenario Visualization  *****\n")
-
-if len(sys.argv) > 1:
-    for arg in sys.argv[1:]:
+# Function returning the artists updated on every frame, used by FuncAnimation to (re)draw the background when blitting
+def initFrame():
+    return projectArtists(g_scnFigure.get_artists()) + g_sliderArtists
+
+# When blitting, FuncAnimation draws the artists one by one without the 3D axes projecting them first
+def projectArtists(artists):
+    if g_blit and g_scn3D:
+        for artist in artists:
+            if hasattr(artist, 'do_3d_projection'):
+                artist.do_3d_projection()
+    return artists
+
+# Extends the figure and the timeline with the nodes read by the background stream since the last refresh,
+# the snapshot, its statistics and its engine are prepared by the reader thread (every g_refreshPeriod)
+def refreshStream():
+    global g_streamScenario
+    prepared = g_scnStream.get_prepared()
+    if prepared is None or prepared[0].version == g_streamScenario.version:
+        return
+    g_streamScenario, engine = prepared
+    stats = g_streamScenario.get_stats()
+    if engine.dims != (3 if g_scn3D else 2):
+        # prepared before the dimensions of the display were known
+        engine = g_streamScenario.get_engine(3 if g_scn3D else 2)
+    g_scnFigure.set_node_count(g_streamScenario.node_count, g_streamScenario.node_ids)
+    g_playback.set_source(FrameSource(engine, g_playback.source.interval, (stats.start_time, stats.end_time)))
+    g_slider.valmin, g_slider.valmax = stats.start_time, stats.end_time
+    g_slider.ax.set_xlim(stats.start_time, stats.end_time)
+
+# Function to plot a frame containing nodes in the figure, frames are (time, locations) pairs given by the playback
+def update(frame):
+    if g_profiler.enabled:
+        start = time.perf_counter()
+    frameTime, loctns = frame
+    if g_scnStream is not None:
+        refreshStream()
+    artists = projectArtists(g_scnFigure.draw_frame(loctns, frameTime))
+    # the slider follows the playback without triggering a seek nor a full redraw
+    g_slider.eventson = False
+    g_slider.set_val(frameTime)
+    g_slider.eventson = True
+    if g_profiler.enabled:
+        g_profiler.add_frame_time(time.perf_counter() - start)
+    return artists + g_sliderArtists
+
+# Keyboard controls of the playback
+def onKey(event):
+    global g_speed
+    if event.key == ' ':
+        g_playback.toggle_pause()
+    elif event.key in ('left', 'right'):
+        g_playback.step(1 if event.key == 'right' else -1)
+    elif event.key in ('down', 'up'):
+        g_playback.seek_time(g_playback.get_time() + (10 if event.key == 'up' else -10))
+    elif event.key == 'home':
+        g_playback.seek(0)
+    elif event.key == 'end':
+        g_playback.seek(g_playback.source.frame_count - 1)
+    elif event.key in ('+', '-'):
+        # The real time between frames is kept, the scenario time between frames changes
+        factor = 2 if event.key == '+' else 0.5
+        g_speed *= factor
+        g_playback.set_interval(g_playback.source.interval * factor)
+        print("speed: {:g}x ({:g}s of scenario per frame)".format(g_speed, g_playback.source.interval))
+    elif event.key == 'l':
+        g_playback.loop = not g_playback.loop
+        print("loop", "on" if g_playback.loop else "off")
+
+def onSlider(value):
+    g_playback.seek_time(value)
+
+# Reads the value of an option expecting a positive number, exits if it is missing or invalid
+def optionValue(option, argIter, valueType):
+    try:
+        value = valueType(next(argIter))
+        if value <= 0:
+            raise ValueError
+        return value
+    except (StopIteration, ValueError):
+        sys.exit("a positive number is expected after '{}' option\n".format(option))
+
+
+# Reads the command line options into the global variables, the last argument that is not an option is the scenario name
+def parseArguments(args):
+    global g_interval, g_speed, g_scnName, g_drawLabel, g_useCache, g_blit, g_saveFile, g_fps, g_dpi, g_jobs, g_intervalGiven
+    global g_lodThreshold, g_lodMode, g_rasterSize, g_loop, g_showStats, g_linkRange, g_contactsFile, g_stream, g_follow
+    global g_validate, g_positionsFile, g_selection
+    argIter = iter(args)
+    for arg in argIter:
         if arg.startswith('-') and arg[1:] == 'l':
             g_drawLabel = True
             print("show nodes' labels")
+        elif arg == '--no-cache':
+            g_useCache = False
+        elif arg == '--noblit':
+            g_blit = False
+        elif arg == '--save':
+            g_saveFile = next(argIter, None)
+            if g_saveFile is None or not g_saveFile.lower().endswith(('.gif', '.mp4')):
+                sys.exit("a .gif or .mp4 filename is expected after '--save' option\n")
+        elif arg == '--fps':
+            g_fps = optionValue(arg, argIter, int)
+        elif arg == '--dpi':
+            g_dpi = optionValue(arg, argIter, int)
+        elif arg == '--interval':
+            g_interval = optionValue(arg, argIter, float)
+            g_intervalGiven = True
+        elif arg == '--speed':
+            g_speed = optionValue(arg, argIter, float)
+        elif arg == '-j':
+            g_jobs = optionValue(arg, argIter, int)
+        elif arg == '--lod':
+            g_lodThreshold = optionValue(arg, argIter, int)
+        elif arg == '--lodmode':
+            g_lodMode = next(argIter, None)
+            if g_lodMode not in ('density', 'decimate'):
+                sys.exit("'density' or 'decimate' expected after '--lodmode' option\n")
+        elif arg == '--loop':
+            g_loop = True
+        elif arg == '--raster':
+            g_rasterSize = optionValue(arg, argIter, int)
+        elif arg == '--stats':
+            g_showStats = True
+        elif arg == '--validate':
+            g_validate = True
+        elif arg == '--links':
+            g_linkRange = optionValue(arg, argIter, float)
+        elif arg in ('--profile', '--cprofile', '--histogram'):
+            try:
+                profile_option(arg, argIter)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg in ('--nodes', '--t0', '--t1'):
+            try:
+                g_selection = slice_option(arg, next(argIter, None), g_selection)
+            except ValueError as e:
+                sys.exit(str(e) + '\n')
+        elif arg == '--stream':
+            g_stream = True
+        elif arg == '--follow':
+            g_stream = True
+            g_follow = True
+        elif arg == '--contacts':
+            g_contactsFile = next(argIter, None)
+            if g_contactsFile is None:
+                sys.exit("a filename is expected after '--contacts' option\n")
+        elif arg == '--positions':
+            g_positionsFile = next(argIter, None)
+            if g_positionsFile is None:
+                sys.exit("a .csv, .npy or .positions filename is expected after '--positions' option\n")
         else:
             g_scnName = arg
-if g_scnName is None:
-    g_scnName = input("Scenario name: ")
-# Read the BonnMotion scenario file and returns times and locations lists
-times, locations = fRead.read_bmScenario(g_scnName + ".movements")
-figParams = fRead.read_bmParams(g_scnName + ".params")
-
-if len(times) == 0 or 'x' not in figParams or 'y' not in figParams:
-    print('')
-    quit()
-if 'J' in figParams:
-    g_scn3D = True if figParams['J'] == '3D' else False
-# If J value .params file is forced 2D even when 3D data is available, allows to plot a 2D view of the data
-g_scn3D = (len(locations[0][0]) == 3) if g_scn3D is True else False
-# Writer = animation.writers['ffmpeg']
-# writer = Writer(fps=20, metadata=dict(artist='Me'), bitrate=1800)
-
-# PREPARING THE FIGURE
-xyRelation, sizeMultiplier = calculateFigDimensions(figParams['x'], figParams['y'])
-if g_scn3D:
-    fig = plt.figure(figsize=(10,4.8))
-    plt.subplots_adjust(left= -0.05, bottom = 0.02, right= 1, top = 0.92)
-else:
-    fig = plt.figure(figsize=plt.figaspect(xyRelation)*sizeMultiplier)
-    plt.subplots_adjust(**getPlotMargins(xyRelation))
-fig.canvas.set_window_title("Drone Mobility Scenario Visualization")
-ax = fig.gca(projection= '3d' if g_scn3D else None)
-if g_scn3D:
-    ax.view_init (elev= 25, azim= -75)
-ax.set_xlim(0, figParams['x'])
-ax.set_ylim(0, figParams['y'])
-ax.set_xlabel('x-axis')
-ax.set_ylabel('y-axis')
-if g_scn3D:
-    zlim = calculateZlim(figParams['x'], figParams['y'], figParams['z'])
-    ax.set_zlim(0, zlim)
-    ax.set_zlabel('z-axis')
-else:
-    ax.grid()
-    ax.set_axisbelow(True)
-    ax.minorticks_on()
-    ax.grid(which='major', linewidth=0.4)
-if 'model' in figParams:
-    ax.title.set_text(f"{g_scnName} ({figParams['model']})")
-else:
-    ax.title.set_text(f"{g_scnName}")
-
-# Global variable initialized with proper object type:
-g_currentSet = ax.scatter(0,0)
-g_labelList = []
-# print(plt.rcParams)
-locationFrame = locationGenerator(times, locations, g_interval)
-# The matplotlib animation function:
-anim = animation.FuncAnimation(fig, update, frames=locationFrame, interval=g_interval*100, save_count=400, repeat_delay= 1000, repeat=False)
-# anim.save(f"{g_scnName}.gif", writer='imagemagick', fps=20, dpi=75, extra_args=None)
-# anim.save(f"{g_scnName}.gif", writer='ffmpeg', fps=20, dpi=80)
-# anim.save(f"{g_scnName}.gif", writer=writer)
-print("Displaying mobility from {}:".format(g_scnName+".movements"))
-print("\t{} scenario".format("3D" if g_scn3D else "2D"))
-print("\t{} nodes".format(len(times)))
-plt.show()
-print('')
+
+# Read the BonnMotion scenario and params files into columnar waypoint arrays (through the binary cache)
+# When streaming, the display starts with the first nodes while the rest of the file is read in background
+# With --nodes, --t0 or --t1 only the selected lines of the .movements file are read (through a line index)
+def loadScenario():
+    global g_scnStream, g_streamScenario
+    if g_stream and g_selection is not None:
+        print("the scenario slice options are not available while streaming, the whole file is read")
+    if g_stream and g_selection is None and g_saveFile is None and g_contactsFile is None and g_positionsFile is None and not (g_showStats or g_validate):
+        try:
+            g_scnStream = ScenarioStream(g_scnName + ".movements", g_follow, refreshPeriod=g_refreshPeriod)
+        except OSError as e:
+            sys.exit(str(e) + '\n')
+        g_scnStream.wait_first_node()
+        scenario = g_scnStream.snapshot()
+        try:
+            scenario.params = read_params(g_scnName + ".params")
+        except OSError:
+            pass
+        g_streamScenario = scenario
+        return scenario
+    if g_selection is not None:
+        return load_slice(g_scnName + ".movements", g_scnName + ".params", useCache=g_useCache, **g_selection)
+    return load_scenario(g_scnName + ".movements", g_scnName + ".params", g_useCache)
+
+# Checks the scenario and prints its problems, returns the exit status (1 when problems are found)
+def validateScenario(scenario):
+    problems = validate_scenario(scenario, g_selection is not None)
+    print("Validation of {}:".format(g_scnName+".movements"))
+    print("\t{} nodes, {} waypoints, {} scenario".format(scenario.node_count, len(scenario.times), "3D" if scenario.is3D else "2D"))
+    for problem in problems:
+        print("\t" + problem)
+    print("\t{}\n".format("{} problems found".format(len(problems)) if problems else "no problems found"))
+    return 1 if problems else 0
+
+# CONTACTS EXPORT, the node pairs within the link range are written for every frame of the timeline
+def exportContacts(scenario, timeRange):
+    if g_linkRange is None:
+        sys.exit("the '--contacts' option requires a link range ('--links R')\n")
+    engine = scenario.get_engine(3 if g_scn3D else 2)
+    frameTimes = FrameSource(engine, g_interval, timeRange).times
+    print("Exporting contacts within {:g} from {} to {}:".format(g_linkRange, g_scnName+".movements", g_contactsFile))
+    contactCount = export_contacts(g_contactsFile, engine, frameTimes, g_linkRange, scenario.node_ids)
+    print("\t{} frames, {} contacts\n".format(len(frameTimes), contactCount))
+
+# POSITIONS EXPORT, the interpolated locations of the nodes are written for every frame of the timeline
+def exportPositions(scenario, timeRange):
+    engine = scenario.get_engine(3 if g_scn3D else 2)
+    frameTimes = FrameSource(engine, g_interval, timeRange).times
+    print("Exporting positions from {} to {}:".format(g_scnName+".movements", g_positionsFile))
+    outFile = export_positions(g_positionsFile, engine, frameTimes, scenario.node_ids)
+    print("\t{} frames of {} nodes, {:.2f}s of scenario per frame".format(len(frameTimes), scenario.node_count, g_interval))
+    print("{} created successfully\n".format(outFile))
+
+# HEADLESS EXPORT, frames are rendered in parallel and encoded at 'g_fps' frames per second, the speed
+# option sets the interval between frames so that 'g_speed' scenario seconds last one second of video
+def saveAnimation(scenario, timeRange, figOptions):
+    global g_interval
+    from my_utils.frameExport import export_animation
+    if not g_intervalGiven:
+        g_interval = g_speed / g_fps
+    frameTimes = FrameSource(scenario.get_engine(3 if g_scn3D else 2), g_interval, timeRange).times
+    print("Exporting mobility from {} to {}:".format(g_scnName+".movements", g_saveFile))
+    print("\t{} frames, {:.2f}s of scenario per frame at {} fps".format(len(frameTimes), g_interval, g_fps))
+    export_animation(g_saveFile, g_scnName + ".movements", g_scnName + ".params", g_scnName, g_scn3D, figOptions, frameTimes,
+                     g_fps, g_dpi, g_jobs, g_useCache, g_selection)
+    print("{} created successfully\n".format(g_saveFile))
+
+# Shows the animation in a matplotlib window until it is closed
+def showAnimation(scenario, figParams, timeRange, figOptions):
+    global g_scnFigure, g_playback, g_slider, g_sliderArtists
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    from matplotlib.widgets import Slider
+    from my_utils.scnFigure import ScenarioFigure, figure_size
+    # PREPARING THE FIGURE
+    # Keys used by the playback are removed from the default matplotlib key bindings
+    playbackKeys = {' ', 'left', 'right', 'down', 'up', 'home', 'end', '+', '-', 'l'}
+    for keymap in [param for param in plt.rcParams if param.startswith('keymap.')]:
+        plt.rcParams[keymap] = [key for key in plt.rcParams[keymap] if key not in playbackKeys]
+    fig = plt.figure(figsize=figure_size(figParams, g_scn3D))
+    g_scnFigure = ScenarioFigure(fig, g_scnName, figParams, g_scn3D, scenario.node_count, animated=g_blit, nodeIds=scenario.node_ids, **figOptions)
+    # Frames are served by a random access frame source, the playback handles pause, seek, loop and speed changes
+    frameSource = FrameSource(scenario.get_engine(3 if g_scn3D else 2), g_interval, timeRange)
+    g_playback = Playback(frameSource, g_loop, g_scnStream is not None)
+    g_slider = Slider(fig.add_axes([0.15, 0.005, 0.7, 0.02]), 'time', frameSource.start_time, frameSource.end_time, valinit=frameSource.start_time)
+    g_slider.drawon = False
+    g_slider.on_changed(onSlider)
+    # the value text lies outside the slider axes, where blitting never restores the background, the time is
+    # shown by the figure instead
+    g_slider.valtext.set_visible(False)
+    g_sliderArtists = [artist for artist in (g_slider.poly, getattr(g_slider, '_handle', None)) if artist is not None]
+    for artist in g_sliderArtists:
+        artist.set_animated(g_blit)
+    fig.canvas.mpl_connect('key_press_event', onKey)
+    # The matplotlib animation function, each frame lasts g_interval/g_speed real seconds:
+    anim = animation.FuncAnimation(fig, update, frames=iter(g_playback), init_func=initFrame, interval=g_interval*1000/g_speed, cache_frame_data=False, blit=g_blit)
+    print("Displaying mobility from {}:".format(g_scnName+".movements"))
+    print("\t{} scenario".format("3D" if g_scn3D else "2D"))
+    if g_scnStream is None:
+        print("\t{} nodes".format(scenario.node_count))
+    else:
+        print("\t{} nodes so far, {} the file in background".format(scenario.node_count, "following" if g_follow else "reading"))
+    print(g_keyHelp)
+    plt.show()
+    if g_scnStream is not None:
+        g_scnStream.stop()
+
+# Runs the tool with the given command line arguments (sys.argv[1:] by default), returns the exit status.
+# The options of a previous call are reset first, so main() can be called several times
+def main(args=None):
+    global g_scnName, g_scn3D
+    globals().update(g_defaults)
+    print("")
+    print("\t\t*****  BonnMotion Scenario Visualization  *****\n")
+    parseArguments(sys.argv[1:] if args is None else args)
+    if g_scnName is None:
+        g_scnName = input("Scenario name: ")
+    scenario = loadScenario()
+    if scenario.node_count == 0:
+        print('')
+        return 0
+    if g_validate:
+        return validateScenario(scenario)
+    # Extents and time span come from the statistics index, the .params extents are completed when missing or too small
+    stats = scenario.get_stats()
+    if g_showStats:
+        print("Statistics of {}:".format(g_scnName+".movements"))
+        print(format_stats(stats, scenario.node_ids))
+        print('')
+        return 0
+    figParams = plot_extents(scenario.params, stats)
+    timeRange = (stats.start_time, stats.end_time)
+    # without a J value in .params the scenario is shown in 2D
+    g_scn3D = figParams.get('J') == '3D'
+    # If J value .params file is forced 2D even when 3D data is available, allows to plot a 2D view of the data
+    g_scn3D = (scenario.dims == 3) if g_scn3D is True else False
+    if g_scnStream is not None:
+        # the reader thread prepares the next snapshots with the dimensions shown
+        g_scnStream.engine_dims = 3 if g_scn3D else 2
+
+    figOptions = dict(drawLabel=g_drawLabel, lodThreshold=g_lodThreshold, lodMode=g_lodMode, rasterSize=g_rasterSize, linkRange=g_linkRange)
+    if g_contactsFile is not None:
+        exportContacts(scenario, timeRange)
+    elif g_positionsFile is not None:
+        exportPositions(scenario, timeRange)
+    elif g_saveFile is not None:
+        saveAnimation(scenario, timeRange, figOptions)
+    else:
+        showAnimation(scenario, figParams, timeRange, figOptions)
+        print('')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())